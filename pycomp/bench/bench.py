@@ -0,0 +1,217 @@
+"""Throughput benchmarks of the lexer and the parsers
+
+For generated programs (see gen.py) of growing size, measures:
+- BasicLexer.lex: tokens/sec (tokens of imports included)
+- BasicLexer.lex_parallel: tokens/sec, with --workers processes (the main
+  file in chunks, see Lexer_parallel_chunk), to compare with lex
+- BasicParser.parse: pt nodes/sec
+- PTParser.parse: time to build the ast
+- PTParser.parse_per_statement: tokens/sec, ast from the tokens with a pt per
+  statement (no pt of the file)
+
+The time per token should stay flat over the sizes. The scaling exponent
+between two sizes is log(time ratio)/log(token ratio): 1 is linear,
+2 is quadratic. Exponents above Bench_exponent_limit are reported.
+
+Results are stored as JSON, and can be compared to a previous run:
+    python3 bench.py --out new.json --compare old.json
+"""
+
+import sys
+import os
+import time
+import json
+import math
+import argparse
+import platform
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lexer
+import parser
+
+import gen
+
+# exponents above this are reported as super-linear
+Bench_exponent_limit = 1.3
+
+# stages, with the unit of their throughput
+Bench_stages = [("lex", "tokens"), ("lex_parallel", "tokens"), ("parse", "nodes"), ("ast", "tokens"),
+                ("statements", "tokens")]
+
+def best_time(f, repeat):
+    """minimal wall time of repeat calls of f, and the last result"""
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = f()
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best, res
+
+def pt_count_nodes(pt):
+    """number of nodes (tokens and inner nodes) of a pt"""
+    n = 0
+    todo = [pt]
+    while len(todo) > 0:
+        pt = todo.pop()
+        n += 1
+        if not pt.isToken:
+            for l in pt.lists:
+                todo.extend(l)
+    return n
+
+def full_ast(ast):
+    """ast with all function bodies parsed, so lazy bodies are timed too"""
+    ast.parse_bodies()
+    return ast
+
+def lex_parallel(seq, name, workers):
+    """lex seq with lex_parallel, returns the lexer (see its fallback)"""
+    l = lexer.BasicLexer()
+    l.lex_parallel(seq, name, workers)
+    return l
+
+def bench_program(path, repeat, workers):
+    """measure all stages on the program with main file path
+    workers: of lex_parallel"""
+    with open(path, "r") as f:
+        seq = f.read()
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(path))
+    try:
+        name = os.path.basename(path)
+        t_lex, tokens = best_time(lambda: lexer.BasicLexer().lex(seq, name), repeat)
+        ntokens = sum(1 for _ in tokens)
+        t_lex_parallel, par = best_time(lambda: lex_parallel(seq, name, workers), repeat)
+        t_parse, pt = best_time(lambda: parser.BasicParser().parse(tokens), repeat)
+        nodes = pt_count_nodes(pt)
+        t_ast, _ = best_time(lambda: full_ast(parser.PTParser().parse(pt)), repeat)
+        t_statements, _ = best_time(lambda: full_ast(parser.PTParser().parse_per_statement(tokens)), repeat)
+    finally:
+        os.chdir(cwd)
+    return {
+        "tokens": ntokens,
+        "nodes": nodes,
+        "lex_s": t_lex,
+        "lex_tokens_per_s": ntokens / t_lex,
+        "lex_parallel_s": t_lex_parallel,
+        "lex_parallel_tokens_per_s": ntokens / t_lex_parallel,
+        "lex_parallel_fallback": par.fallback,
+        "parse_s": t_parse,
+        "parse_nodes_per_s": nodes / t_parse,
+        "ast_s": t_ast,
+        "ast_tokens_per_s": ntokens / t_ast,
+        "statements_s": t_statements,
+        "statements_tokens_per_s": ntokens / t_statements,
+    }
+
+def scaling(results):
+    """max scaling exponent of each stage, over consecutive sizes"""
+    exps = {}
+    for stage, _ in Bench_stages:
+        e = None
+        for a, b in zip(results, results[1:]):
+            if b["tokens"] <= a["tokens"] or a[stage + "_s"] <= 0:
+                continue
+            x = (math.log(b[stage + "_s"] / a[stage + "_s"])
+                 / math.log(b["tokens"] / a["tokens"]))
+            if e is None or x > e:
+                e = x
+        exps[stage] = e
+    return exps
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                             text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def run(sizes, repeat, seed, knobs, workers):
+    """benchmark programs of all sizes (scale of gen.shape_scaled)"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            shape = gen.shape_scaled(size, **knobs)
+            path = gen.generate(os.path.join(tmp, f"size{size}"), shape, seed)
+            res = bench_program(path, repeat, workers)
+            res["size"] = size
+            results.append(res)
+            print(f"size {size:6}: {res['tokens']:9} tokens"
+                  f"  lex {res['lex_tokens_per_s']:10.0f} tokens/s"
+                  f"  lex_parallel {res['lex_parallel_tokens_per_s']:10.0f} tokens/s"
+                  f"  parse {res['parse_nodes_per_s']:10.0f} nodes/s"
+                  f"  ast {res['ast_s']:8.3f} s"
+                  f"  statements {res['statements_s']:8.3f} s")
+            if res["lex_parallel_fallback"] is not None:
+                print(f"  lex_parallel without workers: {res['lex_parallel_fallback']}")
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "seed": seed,
+        "repeat": repeat,
+        "workers": workers,
+        "shape": gen.shape_scaled(1, **knobs),
+        "results": results,
+        "scaling": scaling(results),
+    }
+
+def report_scaling(report):
+    for stage, e in report["scaling"].items():
+        if e is None:
+            continue
+        note = "  <- super-linear" if e > Bench_exponent_limit else ""
+        print(f"scaling {stage:12}: exponent {e:5.2f}{note}")
+
+def compare(report, old):
+    """print the throughput change of each stage and size against old"""
+    old_results = {r["size"]: r for r in old["results"]}
+    print(f"compared to {old.get('commit')}:")
+    for r in report["results"]:
+        o = old_results.get(r["size"])
+        if o is None:
+            continue
+        changes = []
+        for stage, unit in Bench_stages:
+            k = f"{stage}_{unit}_per_s"
+            if k not in o:
+                continue # older run
+            changes.append(f"{stage} {r[k] / o[k]:6.2f}x")
+        print(f"size {r['size']:6}: " + "  ".join(changes))
+
+def parse_knob(text):
+    k, _, v = text.partition("=")
+    if k not in gen.Shape_default:
+        raise argparse.ArgumentTypeError(f"unknown knob {k}, see gen.Shape_default")
+    return k, type(gen.Shape_default[k])(v)
+
+def main(argv):
+    ap = argparse.ArgumentParser(description="lexer and parser throughput benchmarks")
+    ap.add_argument("--sizes", default="1,2,4,8",
+                    help="comma separated scales of the generated program")
+    ap.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="processes of lex_parallel")
+    ap.add_argument("--knob", type=parse_knob, action="append", default=[],
+                    help="shape knob, eg. --knob nesting=4 (see gen.Shape_default)")
+    ap.add_argument("--out", help="write the results to this JSON file")
+    ap.add_argument("--compare", help="JSON file of a previous run")
+    args = ap.parse_args(argv)
+
+    sizes = [float(s) for s in args.sizes.split(",")]
+    report = run(sizes, args.repeat, args.seed, dict(args.knob), args.workers)
+    report_scaling(report)
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,154 @@
+"""Generator of synthetic .script programs for the benchmarks
+
+The programs only use what the lexer, BasicParser and PTParser accept
+(structs, globals, functions with if/else, scopes, calls, returns),
+so every stage can be measured on them.
+The output only depends on the seed and the shape.
+
+usage: python3 gen.py outdir [scale] [seed]
+"""
+
+import sys
+import os
+import random
+
+# knobs of the generated program, see generate
+Shape_default = {
+    "functions": 20,        # number of functions
+    "structs": 10,          # number of structs
+    "globals": 20,          # number of global variables
+    "statements": 6,        # statements per block
+    "expr_length": 4,       # operands per expression (before nesting)
+    "expr_depth": 1,        # nesting of parenthesized sub expressions
+    "nesting": 2,           # nesting of {} blocks in function bodies
+    "comment_density": 0.2, # fraction of lines with a comment
+    "string_density": 0.1,  # fraction of statements that are string variables
+    "imports": 2,           # number of imported files (fan-out of the main file)
+}
+
+def shape_scaled(scale, **knobs):
+    """default shape, the size (functions, structs, globals) times scale"""
+    shape = dict(Shape_default)
+    for k in ["functions", "structs", "globals"]:
+        shape[k] = max(1, int(shape[k] * scale))
+    shape.update(knobs)
+    return shape
+
+class ScriptGenerator:
+    """writes one program (main file and its imports) for a shape"""
+    def __init__(self, shape, seed = 0):
+        self.shape = shape
+        self.rand = random.Random(seed)
+        self.lines = []
+
+    def line(self, indent, text):
+        if self.rand.random() < self.shape["comment_density"]:
+            if self.rand.random() < 0.5:
+                text += " // " + self.words(4)
+            else:
+                self.lines.append(indent + "/* " + self.words(6) + " */")
+        self.lines.append(indent + text)
+
+    def words(self, n):
+        return " ".join(self.rand.choice(["lorem", "ipsum", "dolor", "sit", "amet",
+                                          "TODO", "fast", "path", "x+y", "(a)"])
+                        for _ in range(n))
+
+    def expression(self, names, depth = None):
+        """random arithmetic expression over names and numbers"""
+        if depth is None:
+            depth = self.shape["expr_depth"]
+        parts = []
+        for i in range(max(1, self.shape["expr_length"])):
+            if i > 0:
+                parts.append(self.rand.choice(["+", "-", "*", "+"]))
+            r = self.rand.random()
+            if depth > 0 and r < 0.3:
+                parts.append("(" + self.expression(names, depth-1) + ")")
+            elif r < 0.7 and len(names) > 0:
+                parts.append(self.rand.choice(names))
+            else:
+                parts.append(str(self.rand.randint(0, 1000)))
+        return " ".join(parts)
+
+    def block(self, indent, names, nesting, functions):
+        """statements of a {} block, nested blocks down to nesting 0"""
+        names = list(names)
+        for s in range(self.shape["statements"]):
+            r = self.rand.random()
+            if r < self.shape["string_density"]:
+                text = self.words(3).replace("(", "").replace(")", "")
+                self.line(indent, f"var (*u8) s{len(self.lines)} = \"{text}\\n\";")
+            elif nesting > 0 and r < 0.25:
+                self.line(indent, f"if ({self.expression(names)}) {{")
+                self.block(indent + "   ", names, nesting-1, functions)
+                self.line(indent, "} else {")
+                self.block(indent + "   ", names, nesting-1, functions)
+                self.line(indent, "};")
+            elif nesting > 0 and r < 0.35:
+                self.line(indent, "{")
+                self.block(indent + "   ", names, nesting-1, functions)
+                self.line(indent, "};")
+            elif r < 0.45 and len(functions) > 0:
+                f = self.rand.choice(functions)
+                self.line(indent, f"{f}({self.expression(names)}, {self.expression(names)});")
+            elif r < 0.7:
+                name = f"l{len(self.lines)}"
+                self.line(indent, f"var i32 {name} = {self.expression(names)};")
+                names.append(name)
+            else:
+                self.line(indent, f"{self.rand.choice(names)} = {self.expression(names)};")
+
+    def program(self, part, parts, imports):
+        """text of one file: part of the structs, globals and functions"""
+        shape = self.shape
+        self.lines = []
+        for i in imports:
+            self.lines.append(f"#import \"{i}\"")
+        for i in range(part, shape["structs"], parts):
+            self.line("", f"struct S{i} {{")
+            self.line("   ", "var i32 x;")
+            self.line("   ", "var i32 y;")
+            self.line("   ", "var (*u8) name;")
+            self.line("", "};")
+        globs = [f"g{i}" for i in range(shape["globals"])]
+        for i in range(part, shape["globals"], parts):
+            self.line("", f"var i32 g{i} = {self.rand.randint(0, 100)};")
+        functions = []
+        for i in range(part, shape["functions"], parts):
+            self.line("", f"function i32 f{part}_{i}(var i32 a, var i32 b) {{")
+            self.block("   ", globs + ["a", "b"], shape["nesting"], functions)
+            self.line("   ", f"var i32 r = {self.expression(['a', 'b'])};")
+            self.line("   ", "return r;")
+            self.line("", "};")
+            functions.append(f"f{part}_{i}")
+        return "\n".join(self.lines) + "\n"
+
+    def write(self, outdir):
+        """write main.script and the imported files to outdir
+        returns the path of main.script"""
+        os.makedirs(outdir, exist_ok=True)
+        parts = self.shape["imports"] + 1
+        imports = [f"import{i}.script" for i in range(1, parts)]
+        for i,name in enumerate(imports):
+            with open(os.path.join(outdir, name), "w") as f:
+                f.write(self.program(i+1, parts, []))
+        path = os.path.join(outdir, "main.script")
+        with open(path, "w") as f:
+            f.write(self.program(0, parts, imports))
+        return path
+
+def generate(outdir, shape = None, seed = 0):
+    """write a program of shape (see Shape_default) to outdir
+    returns the path of its main file"""
+    if shape is None:
+        shape = dict(Shape_default)
+    return ScriptGenerator(shape, seed).write(outdir)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python3 gen.py outdir [scale] [seed]")
+        quit()
+    scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    print(generate(sys.argv[1], shape_scaled(scale), seed))
@@ -0,0 +1,80 @@
+"""Memory report of the tokens, the parse tree and the ast
+
+The source is repeated scale times, then lexed and parsed. Reports the
+memory that stays allocated for the token table, for the Tokens in a list,
+and for the pt of BasicParser.parse (measured with tracemalloc).
+The ast of PTParser.parse (with all function bodies parsed) is measured on
+the source once (repeated, its names would be duplicates). Its AST objects
+are counted with a parser.ASTArena.
+
+usage: python3 memory.py [file] [scale]
+default: ../test/test.004.script 1000 times
+"""
+
+import sys
+import os
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import lexer
+import parser
+
+def allocated(f):
+    """result of f, and the bytes it keeps allocated"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    res = f()
+    gc.collect()
+    return res, tracemalloc.get_traced_memory()[0] - before
+
+def pt_count_nodes(pt):
+    """number of inner nodes and of token leafs of a pt"""
+    nodes = 0
+    leafs = 0
+    todo = [pt]
+    while len(todo) > 0:
+        pt = todo.pop()
+        if pt.isToken:
+            leafs += 1
+        else:
+            nodes += 1
+            for l in pt.lists:
+                todo.extend(l)
+    return nodes, leafs
+
+def main(argv):
+    default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "test.004.script")
+    filename = argv[0] if len(argv) > 0 else default
+    scale = int(argv[1]) if len(argv) > 1 else 1000
+    with open(filename, "r") as f:
+        seq = f.read() * scale
+
+    tracemalloc.start()
+    table, table_bytes = allocated(lambda: lexer.BasicLexer().lex(seq, filename))
+    tokens, tokens_bytes = allocated(lambda: list(table))
+    pt, pt_bytes = allocated(lambda: parser.BasicParser().parse(tokens))
+    single = parser.BasicParser().parse(lexer.BasicLexer().lex(seq[:len(seq)//scale], filename))
+    arena = parser.ASTArena()
+    def parse_ast():
+        with arena:
+            ast = parser.PTParser().parse(single)
+            ast.parse_bodies()
+        return ast
+    ast, ast_bytes = allocated(parse_ast)
+    tracemalloc.stop()
+
+    nodes, leafs = pt_count_nodes(pt)
+    mb = 1 << 20
+    print(f"{filename} x{scale}: {len(tokens)} tokens, pt: {nodes} nodes, {leafs} leafs")
+    print(f"token table: {table_bytes / mb:9.1f} MB")
+    print(f"token list:  {tokens_bytes / mb:9.1f} MB")
+    print(f"pt:          {pt_bytes / mb:9.1f} MB ({pt_bytes / max(1, tokens_bytes):.2f}x token list)")
+    ast_nodes = len(arena.nodes)
+    print(f"ast (x1):    {ast_bytes / mb:9.1f} MB ({ast_nodes} nodes, "
+          f"{ast_bytes / max(1, ast_nodes):.0f} bytes per node with what they refer to)")
+    for name, n, size in arena.report():
+        print(f"   {name:32} {n:9} nodes {size:5} bytes")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,12 +2,24 @@
 
 import sys
 import os
+import re
+import bisect
+import hashlib
+import mmap
+import struct
+import io
+import gc
+import contextlib
+import concurrent.futures
+from itertools import repeat
+from array import array
+import numpy as np
 
 class CharSets:
     """Member functions provide common lists of characters"""
 
     def whitespace(self):
-        return [ord(c) for c in " \t\n"]
+        return [ord(c) for c in " \t\r\n"]
     
     def digit(self):
         return [ord(c) for c in "0123456789"]
@@ -38,20 +50,38 @@ class CharSets:
         return [c for c in base if not c in rhs]
 
 class Token:
-    def __init__(self,lex,name,value,line,start, parent = None):
-        self.lex = lex
+    """token of a TokenTable (row), name, value, line and start (column in
+    line) are plain fields. lex, parent (anchor token of an import) and depth
+    are read from the table on access
+    up: anchor token of the import site, if the table is an imported one
+        (a cached table can be imported at several sites, see TokenTable)
+    Tokens are made by the table, see TokenTable.token
+    """
+    __slots__ = ("table", "row", "up", "name", "value", "line", "start")
+    isToken = True # Tokens are the leafs of a parse tree, see parser.PTNode
+
+    def __init__(self, table, row, up, name, value, line, start):
+        self.table = table
+        self.row = row
+        self.up = up
         self.name = name
         self.value = value
         self.line = line
         self.start = start
-        self.parent = parent
-        self.depth = 0
-        if self.parent is not None:
-            self.depth = self.parent.depth + 1
-            if self.depth > 100:
-                print("LexError: lexer depth exceeded.")
-                self.mark()
-                quit()
+
+    @property
+    def lex(self):
+        return self.table.chains[self.table.chain[self.row]][0]
+    @property
+    def parent(self):
+        if self.up is not None:
+            return self.up
+        return self.table.chains[self.table.chain[self.row]][1]
+    @property
+    def depth(self):
+        if self.up is not None:
+            return self.up.depth + 1
+        return self.table.depths[self.table.chain[self.row]]
 
     def __repr__(self):
         return f"<{self.name}, {self.value}, {self.line}, {self.start}>"
@@ -60,43 +90,361 @@ class Token:
         if self.parent is not None:
             self.parent.mark()
         print(f"in {self.lex.filename}:{self.line}")
-        print(self.lex.lines[self.line][:-1])
-        prefix = self.lex.lines[self.line][:self.start]
+        text = self.lex.line_text(self.line)
+        print(text)
+        prefix = text[:self.start]
         prefix = "".join([("\t" if c=="\t" else " ") for c in prefix])
         print(prefix+"^")
 
+# kind names of tokens, TokenTable stores the index
+TokenTable_kinds = ["name", "keyword", "type", "num", "str",
+                    "operator", "bracket", "semicolon", "comma", "anchor"]
+TokenTable_kind_id = {k:i for i,k in enumerate(TokenTable_kinds)}
+
+class TokenTable:
+    """tokens stored as columns (struct of arrays), one row per token
+
+    kind: index into TokenTable_kinds
+    offset, length: span of the token in the sequence of its lexer
+    line, column: position for diagnostics
+    chain: index into chains, (lex, parent) of the token.
+        parent is the anchor token of the import chain (or None)
+
+    values are only materialized on access, from the sequence of the lexer.
+    names are interned. values that are not a plain slice (decoded strings,
+    anchors) are kept in values.
+
+    imports: anchor row -> TokenTable of the imported file. Iterating the
+    table iterates the imported tables in place of the anchor rows, their
+    tokens get the anchor as parent (Token.up). So the table of a file can
+    be imported many times without copying it.
+
+    Once lexing is done, the Tokens are made in bulk on the first iteration
+    and kept (token_cache), indexing uses an index of the imports
+    (import_index). Both are built again if rows were pushed since.
+    """
+
+    def __init__(self):
+        self.kind = array('i')
+        self.offset = array('i')
+        self.length = array('i')
+        self.line = array('i')
+        self.column = array('i')
+        self.chain = array('i')
+        self.chains = [] # (lex, parent)
+        self.depths = [] # per chain
+        self.chain_id = {} # lex -> chain
+        self.values = {} # row -> value
+        self.imports = {} # row -> TokenTable
+        self.fields_cache = None # see row_fields
+        self.index_cache = None # see import_index
+        self.token_cache = None # (rows, tokens of iteration)
+
+    def push(self, lex, name, offset, length, line, column, value = None):
+        """append a token of lexer lex, returns its row"""
+        c = self.chain_id.get(lex)
+        first = c is None
+        if first:
+            c = self.add_chain(lex)
+        kind = TokenTable_kind_id.get(name)
+        if kind is None:
+            kind = len(TokenTable_kinds)
+            TokenTable_kinds.append(name)
+            TokenTable_kind_id[name] = kind
+
+        row = len(self.kind)
+        self.kind.append(kind)
+        self.offset.append(offset)
+        self.length.append(length)
+        self.line.append(line)
+        self.column.append(column)
+        self.chain.append(c)
+        if value is not None:
+            self.values[row] = value
+
+        if first and self.depths[c] > 100: # the depth of a chain is fixed
+            print("LexError: lexer depth exceeded.")
+            self.token(row).mark()
+            quit()
+        return row
+
+    def add_chain(self, lex):
+        parent = lex.anchor_token
+        c = len(self.chains)
+        self.chains.append((lex, parent))
+        self.depths.append(0 if parent is None else parent.depth + 1)
+        self.chain_id[lex] = c
+        return c
+
+    def value(self, row):
+        v = self.values.get(row)
+        if v is not None:
+            return v
+        kind = self.kind[row]
+        offset = self.offset[row]
+        seq = self.chains[self.chain[row]][0].seq
+        if kind == TokenTable_str:
+            # decode on access, without quotes
+            v = decode_string(seq[offset+1:offset+self.length[row]-1])
+            self.values[row] = v
+            return v
+        v = seq[offset:offset+self.length[row]]
+        if kind <= TokenTable_type:
+            v = sys.intern(v)
+        return v
+
+    def push_rows(self, lex, columns, lo, hi):
+        """append rows lo:hi of columns (kind, offset, length, line, column)
+        for tokens of lexer lex, eg. from the token cache"""
+        if lo >= hi:
+            return
+        row = len(self.kind)
+        c = self.chain_id.get(lex)
+        if c is None:
+            c = self.add_chain(lex)
+        kind, offset, length, line, column = columns
+        self.kind += kind[lo:hi]
+        self.offset += offset[lo:hi]
+        self.length += length[lo:hi]
+        self.line += line[lo:hi]
+        self.column += column[lo:hi]
+        self.chain += array('i', [c]) * (hi-lo)
+        if self.depths[c] > 100:
+            print("LexError: lexer depth exceeded.")
+            self.token(row).mark()
+            quit()
+
+    def push_import(self, lex, offset, length, line, column, table):
+        """append an anchor row for an import of table, returns the anchor token
+        offset, length: the import line after the #"""
+        row = self.push(lex, "anchor", offset, length, line, column, "anchor")
+        self.imports[row] = table
+        return self.token(row)
+
+    def copy_rows(self, lex, other, lo, hi, doffset = 0, dline = 0, dcolumn = 0, cline = None):
+        """append rows lo:hi of TokenTable other as tokens of lexer lex,
+        moved by doffset characters and dline lines. The rows on line cline
+        are also moved by dcolumn columns. imports are kept."""
+        columns = [other.kind, other.offset, other.length, other.line, other.column]
+        if doffset != 0 or dline != 0 or dcolumn != 0:
+            moved = []
+            for c,d in zip(columns, [0, doffset, 0, dline, 0]):
+                moved.append(np.frombuffer(c, dtype=np.int32)[lo:hi] + d)
+            if dcolumn != 0:
+                line = np.frombuffer(other.line, dtype=np.int32)[lo:hi]
+                moved[4] = moved[4] + np.where(line == cline, dcolumn, 0).astype(np.int32)
+            for i,c in enumerate(moved):
+                a = array('i')
+                a.frombytes(c.astype(np.int32).tobytes())
+                moved[i] = a
+            columns = moved
+            lo, hi, base = 0, hi-lo, lo
+        else:
+            base = 0
+        anchors = sorted(r - base for r in other.imports if lo <= r - base < hi)
+        for r in anchors:
+            self.push_rows(lex, columns, lo, r)
+            self.push_import(lex, columns[1][r], columns[2][r], columns[3][r],
+                             columns[4][r], other.imports[r + base])
+            lo = r+1
+        self.push_rows(lex, columns, lo, hi)
+
+    def token(self, row, up = None):
+        """Token of row, up: anchor token of the import site (or None)"""
+        return Token(self, row, up, TokenTable_kinds[self.kind[row]],
+                     self.value(row), self.line[row], self.column[row])
+
+    def row_fields(self):
+        """(names, values): lists with the name and value of every row"""
+        cache = self.fields_cache
+        if cache is not None and len(cache[0]) == len(self.kind):
+            return cache
+        kinds = TokenTable_kinds
+        names = [kinds[k] for k in self.kind]
+        seqs = [lex.seq for lex,_ in self.chains]
+        intern = sys.intern
+        last = TokenTable_type
+        values = [intern(seqs[c][o:o+n]) if k <= last else seqs[c][o:o+n]
+                  for k,c,o,n in zip(self.kind, self.chain, self.offset, self.length)]
+        strs = np.flatnonzero(np.frombuffer(self.kind, dtype=np.int32) == TokenTable_str)
+        for row in strs.tolist():
+            values[row] = self.value(row)
+        for row,v in self.values.items():
+            values[row] = v
+        self.fields_cache = (names, values)
+        return self.fields_cache
+
+    def tokens(self, up):
+        """list of the tokens of the table, with the imported ones in place
+        of the anchors. up is the anchor for all of them (or None)"""
+        names, values = self.row_fields()
+        line = self.line
+        column = self.column
+        tokens = []
+        lo = 0
+        for row in sorted(self.imports) + [len(self.kind)]:
+            tokens += map(Token, repeat(self), range(lo, row), repeat(up), names[lo:row],
+                          values[lo:row], line[lo:row], column[lo:row])
+            if row < len(self.kind):
+                tokens += self.imports[row].tokens(self.token(row, up))
+            lo = row + 1
+        return tokens
+
+    def import_index(self):
+        """(anchor rows, starts, n): the sorted anchor rows, the index of the
+        first token of each import (as counted in iteration), and the number
+        of tokens including imported ones"""
+        cache = self.index_cache
+        if cache is not None and cache[0] == len(self.kind):
+            return cache[1]
+        rows = sorted(self.imports)
+        starts = []
+        n = 0
+        lo = 0
+        for row in rows:
+            n += row - lo
+            starts.append(n)
+            n += len(self.imports[row])
+            lo = row + 1
+        n += len(self.kind) - lo
+        self.index_cache = (len(self.kind), (rows, starts, n))
+        return self.index_cache[1]
+
+    def __len__(self):
+        """number of tokens, including imported ones"""
+        return self.import_index()[2]
+
+    def __getitem__(self, i):
+        """token i (or list of tokens of a slice), counted as in iteration"""
+        cache = self.token_cache
+        if cache is not None and cache[0] == len(self.kind):
+            return cache[1][i]
+        if isinstance(i, slice):
+            return [self.token_at(j, None) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("TokenTable index out of range")
+        return self.token_at(i, None)
+
+    def token_at(self, i, up):
+        """token i of tokens(up), 0 <= i < len(self)"""
+        rows, starts, _ = self.import_index()
+        k = bisect.bisect_right(starts, i) - 1
+        if k < 0:
+            return self.token(i, up)
+        row = rows[k]
+        table = self.imports[row]
+        i -= starts[k]
+        if i < len(table):
+            return table.token_at(i, self.token(row, up))
+        return self.token(row + 1 + i - len(table), up)
+
+    def __iter__(self):
+        cache = self.token_cache
+        if cache is None or cache[0] != len(self.kind):
+            # the Tokens have no reference cycles, but so many new objects
+            # would trigger full collections, that scan all older objects again
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                cache = self.token_cache = (len(self.kind), self.tokens(None))
+            finally:
+                if enabled:
+                    gc.enable()
+        return iter(cache[1])
+
+# kinds with special handling in TokenTable.value
+TokenTable_type = TokenTable_kind_id["type"] # name, keyword, type are interned
+TokenTable_str = TokenTable_kind_id["str"]
+# kinds pushed in bulk by the engines, see BasicLexer.push_columns
+TokenTable_name = TokenTable_kind_id["name"]
+TokenTable_num = TokenTable_kind_id["num"]
+TokenTable_operator = TokenTable_kind_id["operator"]
+TokenTable_bracket = TokenTable_kind_id["bracket"]
+TokenTable_semicolon = TokenTable_kind_id["semicolon"]
+TokenTable_comma = TokenTable_kind_id["comma"]
+TokenTable_anchor = TokenTable_kind_id["anchor"]
+
+# escape sequences of string tokens: \xHH or one character
+decode_string_escape = re.compile(r'\\(?:x..|.)', re.DOTALL)
+# escape sequence -> character, \xHH are added on first use
+decode_string_chars = {"\\n":"\n", "\\t":"\t", "\\\'":"\'", "\\\"": "\"","\\\\":"\\"}
+
+def decode_string_sub(m):
+    e = m.group()
+    c = decode_string_chars.get(e)
+    if c is None:
+        if e[1] != "x":
+            print(e[1], ord(e[1]), m.string)
+            assert(False)
+        c = decode_string_chars[e] = chr(int(e[2:], 16))
+    return c
+
+def decode_string(value):
+    """decode escape sequences of a string token value (without quotes)"""
+    if "\\" not in value:
+        return value
+    return decode_string_escape.sub(decode_string_sub, value)
+
 class Lexer:
     """FSM based lexer
     
     state: one of finetely many, "init" is the initial state, and the neutral state whenever no particular token is being tokenized
-    start: points to first character of current token
-    action(line,linenum,state,start,pos): decide what to do with newly added character at position pos.
+    start: points to first character of current token (offset in seq)
+    action(lex,seq,state,start,pos): decide what to do with newly added character at offset pos.
+        lex is the lexer, so the actions (and the rules) can be shared by all instances
     tokens: list of already processed tokens, can append new tokens
     rules: list of (state,character,action) tuples. given a state and next character, choose action.
+    compiled: if True, rules are compiled into dense per-state transition tables (see compile_rules)
+
+    The whole sequence is lexed as one buffer, with absolute offsets.
+    The line of a token is counted when it is pushed, the line start
+    index (line_starts) is only built if a diagnostic needs the text of a line.
     """
 
-    def __init__(self):
+    def __init__(self, compiled = True):
         """Constructor"""
         self.rules = []
         self.state_dict = {}
+        self.compiled = compiled
         self.isUsed = False
         self.anchor_token = None
     
-    def push_token(self, name, value):
+    def push_token(self, name, value, length = None):
         """Push current token for a type name and value
         
-        internally, also start position in line are remembered
+        value must be seq[start:start+len(value)], it is not stored but read
+        again from seq when needed. For other values, give the length of the
+        token in seq: then value is stored.
+        internally, also line and start position in line are remembered
         """
-        token = Token(self,name,value,self.line,self.start,self.anchor_token)
-        #print("push_token:",token)
-        self.tokens.append(token)
+        self.sync_line(self.start)
+        if length is None:
+            length = len(value)
+            value = None
+        self.tokens.push(self,name,self.start,length,self.line,self.start-self.linestart,value)
 
+    def sync_line(self, pos):
+        """advance self.line and self.linestart to offset pos
+        pos must not be before the last synced offset
+        """
+        if pos > self.linepos:
+            n = self.seq.count("\n", self.linepos, pos)
+            if n > 0:
+                self.line += n
+                self.linestart = self.seq.rfind("\n", self.linepos, pos) + 1
+            self.linepos = pos
 
     def set_rules(self, rules):
         """argument: rules, list of (state, [chars], action) tuples.
-        chars is a list of characters (ord)
-        action(line,linenum,state,start,pos): returns (accept, state, start)
+        chars is a list of characters (ord), -1 stands for all other characters
+        action(lex,seq,state,start,pos): returns (accept, state, start)
         if accept is false, the current character is tried again, else advanced
+        action can also be a state name: then the character is accepted and
+        we move to that state, without calling anything. This is used for
+        all characters that are neither the first nor the last of a token.
         """
         self.rules = rules
 
@@ -115,86 +463,462 @@ class Lexer:
                     print(f"LexError: already found {c} '{chr(c)}' in state_dict for state '{state}'")
                     quit()
                 sd[c] = action
-            
+
+        self.compile_rules()
+
+    def rule_tables(self):
+        """the tables built by set_rules, to share with use_rule_tables"""
+        return (self.rules, self.state_dict, self.state_name, self.state_id,
+                self.trans, self.action)
+
+    def use_rule_tables(self, tables):
+        """use the tables of another lexer with the same rules (read-only)"""
+        (self.rules, self.state_dict, self.state_name, self.state_id,
+         self.trans, self.action) = tables
+
+    def compile_rules(self):
+        """compile state_dict into dense tables
+
+        states are mapped to small ints: state_id[name], state_name[id]
+        per state there is a transition array with 256+1 entries,
+        the last one (index -1) is the default slot for all other characters:
+        trans[state][c]: next state id for a plain transition,
+                         or -1 if an action must be called
+        action[state][c]: the action, or None if there is no rule (error)
+        """
+        self.state_name = list(self.state_dict.keys())
+        self.state_id = {name:i for i,name in enumerate(self.state_name)}
+
+        self.trans = []
+        self.action = []
+        for name in self.state_name:
+            sd = self.state_dict[name]
+            default = sd.get(-1)
+            trans = [-1]*257
+            action = [None]*257
+            for c in range(257):
+                a = sd.get(c, default) if c < 256 else default
+                if isinstance(a, str):
+                    if not a in self.state_id:
+                        print(f"LexError (internal): state '{a}' has no rules")
+                        quit()
+                    trans[c] = self.state_id[a]
+                else:
+                    action[c] = a
+            self.trans.append(trans)
+            self.action.append(action)
 
     def lex(self, seq, filename):
         """lexes a sequence seq, returns a list of tokens. filename for error messages"""
+        self.lex_begin(seq, filename)
+        self.lex_engine()
+        return self.tokens
+
+    def iter_tokens(self, seq, filename):
+        """lexes a sequence seq lazily, generator of tokens. filename for error messages
+
+        seq is lexed in chunks of about Lexer_block_size characters, only the
+        tokens of the current chunk are held. Segments pushed with push_segment
+        (imports) are only consumed once the stream gets to them.
+        """
+        self.lex_begin(seq, filename)
+        self.pending = []
+        end = len(seq)
+        while True:
+            stop = self.pos + Lexer_block_size
+            if stop >= end:
+                stop = None # last chunk, includes the virtual end of line
+            jumped = self.lex_engine(stop)
+
+            self.pending.append(self.tokens)
+            self.tokens = TokenTable()
+            pending = self.pending
+            self.pending = []
+            for segment in pending:
+                yield from segment
+
+            if stop is None and not jumped:
+                return
+
+    def lex_begin(self, seq, filename):
+        """set up lexing of seq"""
         assert(self.isUsed == False)
         self.isUsed = True
 
         self.filename = filename
-        self.tokens = []
+        self.seq = seq
+        self.tokens = TokenTable()
         self.start = 0
-        self.line = 0
         self.state = "init"
         self.pos = 0
 
-        lines = [l+"\n" for l in seq.splitlines()]
-        self.lines = lines
+        # line counting, see sync_line
+        self.line = 0
+        self.linestart = 0
+        self.linepos = 0
+        self.line_starts = None # built on demand, see line_index
+
+        self.pending = None # segments waiting to be streamed, see iter_tokens
+        self.jump = None # see lex_engine
 
+    def push_segment(self, tokens):
+        """when streaming: push an iterable of tokens after the current ones
+        (eg. an import), it is only consumed once the stream gets there
+        """
+        assert(self.pending is not None)
+        self.pending.append(self.tokens)
+        self.pending.append(tokens)
+        self.tokens = TokenTable()
+
+    def lex_engine(self, end = None):
+        """lex self.seq from self.pos to at least end, push tokens
+        if end is None: lex to the end
+        afterwards, self.pos is where lexing continues
+
+        an action can set self.jump: lexing continues at that offset, in init.
+        when streaming, lex_engine stops there and returns True, so that the
+        stream first catches up (eg. with an import).
+        """
         while True:
+            self.jump = None
+            self.lex_run(end)
+            if self.jump is None:
+                return False
+            if self.pending is not None:
+                return True
+
+    def lex_run(self, end = None):
+        """lex with the engine, see lex_engine"""
+        if self.compiled:
+            self.lex_compiled(self.pos, end)
+        else:
+            self.lex_reference(end)
+
+    def lex_compiled(self, pos = 0, end = None):
+        """lex with the tables from compile_rules
+        plain transitions only cost one table lookup per character,
+        actions are only called on token boundaries
+        lexes seq[pos:end], starting in self.state
+        if end is None: lex to the end, with a final "\n" if missing
+        """
+        seq = self.seq
+        trans = self.trans
+        actions = self.action
+        state_id = self.state_id
+        state_name = self.state_name
+        init = state_id["init"]
+
+        if end is None:
+            end = len(seq)
+            eof = (end == 0 or seq[end-1] != "\n")
+        else:
+            eof = False
+
+        state = state_id[self.state]
+        start = self.start
+        while pos < end or eof:
+            # work through blocks, so the encoded copy stays small
+            base = pos
+            stop = min(end, base + Lexer_block_size)
+            try:
+                codes = seq[base:stop].encode("latin-1")
+            except UnicodeEncodeError:
+                codes = [min(ord(c), 256) for c in seq[base:stop]] # 256: default slot
+            if stop == end and eof:
+                # virtual end of last line
+                if isinstance(codes, bytes):
+                    codes += b"\n"
+                else:
+                    codes.append(10)
+                eof = False
+
+            i = 0
+            n = len(codes)
+            while i < n:
+                if state == init:
+                    start = base + i
+                nxt = trans[state][codes[i]]
+                if nxt >= 0:
+                    state = nxt
+                    i += 1
+                    continue
+
+                action = actions[state][codes[i]]
+                self.pos = base + i
+                self.start = start
+                if action is None:
+                    c = seq[base+i] if base+i < len(seq) else "\n"
+                    print(f"LexError: unexpected character {ord(c)} '{c}' for state {state_name[state]}")
+                    self.mark_pos()
+                    quit()
+
+                accept, name, start = action(self, seq, state_name[state], start, base+i)
+                if self.jump is not None:
+                    self.state = name
+                    self.pos = self.jump
+                    return
+                state = state_id[name]
+                if accept:
+                    i += 1
+            pos = base + n
+
+        self.state = state_name[state]
+        self.start = start
+        self.pos = pos
+
+    def lex_reference(self, end = None):
+        """lex with the state_dict, one rule lookup per character
+        lexes up to offset end, or to the end if end is None
+        """
+        seq = self.seq
+        n = len(seq)
+        if end is None:
+            end = n if n > 0 and seq[-1] == "\n" else n + 1 # virtual end of last line
+
+        state_dict = self.state_dict
+        state = self.state
+        start = self.start
+        pos = self.pos
+        while pos < end:
             # check if rule available for state:
-            if not self.state in self.state_dict:
-                print(f"LexError (internal): state '{self.state}' has no rules")
+            sd = state_dict.get(state)
+            if sd is None:
+                print(f"LexError (internal): state '{state}' has no rules")
                 quit()
-            
-            sd = self.state_dict[self.state]
-            c = ord(lines[self.line][self.pos])
-            
+
+            c = ord(seq[pos]) if pos < n else 10 # "\n"
+
             # check if rule available for character and state
-            action = None
-            if c in sd:
-                action = sd[c]
-            elif -1 in sd:
-                action = sd[-1]
-            else:
-                print(f"LexError: unexpected character {c} '{chr(c)}' for state {self.state}")
-                self.mark_pos()
-                quit()
-            
-            accept, state, start = action(lines[self.line], self.line, self.state, self.start, self.pos)
+            action = sd.get(c)
+            if action is None:
+                action = sd.get(-1)
+                if action is None:
+                    self.state, self.start, self.pos = state, start, pos
+                    print(f"LexError: unexpected character {c} '{chr(c)}' for state {state}")
+                    self.mark_pos()
+                    quit()
+
+            if state == "init":
+                start = pos # a token can only start here
+
+            if isinstance(action, str):
+                # plain transition
+                state = action
+                pos += 1
+                continue
 
-            self.state = state
+            self.pos = pos
             self.start = start
-            
+            accept, state, start = action(self, seq, state, start, pos)
+            if self.jump is not None:
+                self.state = state
+                self.pos = self.jump
+                return
+
             if accept:
-                self.pos += 1
-                if self.pos >= len(lines[self.line]):
-                    # end of line, already passed "\n"
-                    if self.state != "init" and self.state != "com2":
-                        print(f"LexError: end of line not 'init' but '{self.state}' state for line {self.line}")
-                        print(lines[self.line])
-                        quit()
-                    self.start = 0
-                    self.pos = 0
-                    self.line += 1
+                pos += 1
 
-                    if self.line >= len(lines):
-                        break # end of file
+        self.state = state
+        self.start = start
+        self.pos = pos
+
+    def line_index(self):
+        """offsets of all line starts in seq, built on first use"""
+        if self.line_starts is None:
+            starts = [0]
+            find = self.seq.find
+            i = find("\n")
+            while i >= 0:
+                starts.append(i+1)
+                i = find("\n", i+1)
+            self.line_starts = starts
+        return self.line_starts
+
+    def line_of(self, pos):
+        """line number of offset pos"""
+        return bisect.bisect_right(self.line_index(), pos) - 1
+
+    def line_text(self, linenum):
+        """text of line linenum, without the newline"""
+        starts = self.line_index()
+        if linenum >= len(starts):
+            return ""
+        end = self.seq.find("\n", starts[linenum])
+        if end < 0:
+            end = len(self.seq)
+        return self.seq[starts[linenum]:end]
 
-        return self.tokens
-    
     def mark_parent(self):
         if self.parent is not None:
             self.parent.mark_start()
 
+    def mark_offset(self, pos):
+        line = self.line_of(pos)
+        print(f"in {self.filename}:{line}")
+        print(self.line_text(line))
+        print(" "*(pos - self.line_index()[line])+"^")
+
     def mark_pos(self):
         self.mark_parent()
-        print(f"in {self.filename}:{self.line}")
-        print(self.lines[self.line][:-1])
-        print(" "*self.pos+"^")
+        self.mark_offset(self.pos)
 
     def mark_line(self,linenum):
         self.mark_parent()
         print(f"in {self.filename}:{linenum}")
-        print(self.lines[self.line][:-1])
-
+        print(self.line_text(linenum))
 
     def mark_start(self):
-        print(f"in {self.filename}:{self.line}")
-        print(self.lines[self.line][:-1])
-        print(" "*self.start+"^")
+        self.mark_offset(self.start)
+
+# lex_compiled encodes the sequence in blocks of this many characters
+Lexer_block_size = 1 << 16
+
+
+BasicLexer_keywords = [
+        "struct","function","var","const",
+        "cast","sizeof",
+        "if","else","elif",
+        "while","for",
+        "return",
+        ]
 
+BasicLexer_types = [
+        "i32",
+        "float","double",
+        "u64","u32","u16","u8",
+        "void",
+        ]
+
+BasicLexer_name = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# preprocessor lines that change the macros or skip lines
+BasicLexer_macro_directive = re.compile(r'\#(?:define|undefine|ifdef|endif)(?=[ \n]|\Z)', re.IGNORECASE)
+# nesting of skipped IFDEF regions
+BasicLexer_ifdef = re.compile(r'\#(?:(ifdef)|endif)(?=[ \n]|\Z)', re.IGNORECASE)
+
+def lex_uses_macros(seq):
+    """True if seq may define macros or skip lines"""
+    return BasicLexer_macro_directive.search(seq) is not None
+
+# token kind of names that are not plain names
+BasicLexer_name_kind = {}
+for k in BasicLexer_keywords:
+    BasicLexer_name_kind[k] = "keyword"
+for t in BasicLexer_types:
+    BasicLexer_name_kind[t] = "type"
+# the same as index into TokenTable_kinds, see BasicLexer.push_columns
+BasicLexer_name_kind_id = {v:TokenTable_kind_id[k] for v,k in BasicLexer_name_kind.items()}
+
+# operators:
+#   some are single char, some multichar.
+#   list is converted into query structure (FSM) or pattern (regex)
+BasicLexer_operators = ["==", "<", ">", "<=", ">=", "!", "!=",
+        "&", "&&", "|","||", "%", "^", ">>", "<<",
+        "*", "/", "~",
+        "+", "++", "-", "--", "->", ".",
+        "=","+=", "-=","/=","*=",
+        "//","/*",# For comments
+        ]
+
+def basic_lexer_operator_trie():
+    """operator trie as a flat table
+    returns (trie, accept): trie[(node, ord(c))] is the next node,
+    accept[node] is the operator that ends at node, or None. 0 is the root.
+    """
+    trie = {}
+    accept = [None]
+    for o in BasicLexer_operators:
+        node = 0
+        for char in o:
+            key = (node, ord(char))
+            if not key in trie:
+                trie[key] = len(accept)
+                accept.append(None)
+            node = trie[key]
+        accept[node] = o
+    return trie, accept
+
+BasicLexer_operator_trie, BasicLexer_operator_accept = basic_lexer_operator_trie()
+
+# a complete string token (see the str rules of BasicLexer)
+BasicLexer_string_pattern = r'"(?:[ !\#-\[\]-~]|\\(?:["\'nt\\]|x[0-9A-Fa-f]{2}))*"'
+BasicLexer_string = re.compile(BasicLexer_string_pattern)
+
+def basic_lexer_regex():
+    """One pattern for all tokens of BasicLexer, used with finditer.
+    Alternatives are tried in order, so comments come before operators,
+    and operators are sorted longest first (maximal munch).
+    Everything that does not match ends up in the error group.
+    Like for the FSM, only characters up to 255 are allowed, also in comments.
+    """
+    operators = [o for o in BasicLexer_operators if o not in ["//","/*"]]
+    operators.sort(key=len, reverse=True)
+    return re.compile("|".join([
+        r'(?P<ws>[ \t\r\n]+)',
+        r'(?P<com>//[\x00-\t\x0b-\xff]*)',
+        r'(?P<com2>/\*[\x00-\xff]*?(?:\*/|\Z|(?=[^\x00-\xff])))',
+        r'(?P<pre>\#[\x00-\t\x0b-\xff]*)',
+        r'(?P<name>[A-Za-z_][A-Za-z0-9_]*)',
+        r'(?P<num>[0-9][0-9.]*)',
+        r'(?P<str>' + BasicLexer_string_pattern + r')',
+        r'(?P<operator>' + "|".join([re.escape(o) for o in operators]) + r')',
+        r'(?P<bracket>[()\[\]{}])',
+        r'(?P<semicolon>;)',
+        r'(?P<comma>,)',
+        r'(?P<error>.)',
+        ]), re.DOTALL)
+
+BasicLexer_regex = basic_lexer_regex()
+# groups of BasicLexer_regex that are always one token of the same kind
+BasicLexer_regex_kind = {"operator":TokenTable_operator, "bracket":TokenTable_bracket,
+                         "semicolon":TokenTable_semicolon, "comma":TokenTable_comma,
+                         "str":TokenTable_str}
+
+# character classes for the numpy engine
+NPClass_ws = 0
+NPClass_newline = 1
+NPClass_letter = 2 # and underscore
+NPClass_digit = 3
+NPClass_operator = 4
+NPClass_bracket = 5
+NPClass_semicolon = 6
+NPClass_comma = 7
+NPClass_quote = 8
+NPClass_hash = 9
+NPClass_other = 10
+
+def basic_lexer_classes():
+    """lookup table character -> class, entry 256 for all characters above 255"""
+    cs = CharSets()
+    lut = np.full(257, NPClass_other, dtype=np.uint8)
+    for c in set(ord(c) for o in BasicLexer_operators for c in o):
+        lut[c] = NPClass_operator
+    lut[cs.letter() + [ord("_")]] = NPClass_letter
+    lut[cs.digit()] = NPClass_digit
+    lut[cs.bracket()] = NPClass_bracket
+    lut[cs.whitespace()] = NPClass_ws
+    lut[ord("\n")] = NPClass_newline
+    lut[ord(";")] = NPClass_semicolon
+    lut[ord(",")] = NPClass_comma
+    lut[ord("\"")] = NPClass_quote
+    lut[ord("#")] = NPClass_hash
+    return lut
+
+BasicLexer_classes = basic_lexer_classes()
+
+def np_codes(seq):
+    """character codes of seq as numpy array, 256 for characters above 255"""
+    try:
+        return np.frombuffer(seq.encode("latin-1"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        codes = np.frombuffer(seq.encode("utf-32-le"), dtype=np.uint32)
+        return np.minimum(codes, 256)
+
+def np_next(mask):
+    """for every i: smallest j >= i with mask[j]. the last entry must be True"""
+    n = len(mask)
+    idx = np.where(mask, np.arange(n, dtype=np.int32), np.int32(n-1))
+    return np.ascontiguousarray(np.minimum.accumulate(idx[::-1])[::-1])
 
 class BasicLexer(Lexer):
     """Lexer that is initialized with the rules to lex
@@ -203,351 +927,1046 @@ class BasicLexer(Lexer):
     - numers (decimal with dot)
     - brackets ()[]{}
     - comma, semicolon
-    - operators (for list see below)
+    - operators (for list see above)
     - single line comments starting with #
     
     Macros:
     - ECHO: prints whole line
     - IMPORT: lex other file, append tokens to list
+        the tokens of a file are lexed once and reused for further imports
+    - ONCE: further imports of this file are ignored
+    - DEFINE name tokens...: from now on, name stands for the tokens
+        (the rest of the line). the tokens are referenced, not copied.
+    - UNDEFINE name
+    - IFDEF name ... ENDIF: the lines in between are skipped if name is not
+        defined. they are not lexed, the matching ENDIF is found with a search
+        for #IFDEF and #ENDIF (these also count inside comments and strings).
+
+    engine: "fsm" (reference implementation, rules below)
+            "regex" (one combined pattern, see basic_lexer_regex)
+            "numpy" (vectorized character classes, see lex_numpy)
+    all produce the same tokens.
+    cache_dir: if not None, directory of the on-disk token cache for
+            imported files (see lex_cached)
     """
-    def __init__(self, parent = None, anchor_token = None):
-        super().__init__()
+    def __init__(self, parent = None, anchor_token = None, compiled = True, engine = "fsm", cache_dir = None):
+        super().__init__(compiled)
         self.parent = parent
         self.anchor_token = anchor_token
+        if not engine in ["fsm", "regex", "numpy"]:
+            print(f"LexError: unknown lexer engine '{engine}'")
+            quit()
+        self.engine = engine
+        self.oper_node = 0 # cursor into BasicLexer_operator_trie
 
-        ### set up rules:
-        
+        # shared by all lexers of one compilation, see preprocessor_exec
+        if parent is None:
+            self.import_cache = {} # realpath -> TokenTable
+            self.import_once = set() # realpaths of files with ONCE
+            self.cache_dir = cache_dir # on-disk token cache for imports, see lex_cached
+            self.macros = {} # name -> TokenTable, see DEFINE
+        else:
+            self.import_cache = parent.import_cache
+            self.import_once = parent.import_once
+            self.cache_dir = parent.cache_dir
+            self.macros = parent.macros
+        self.ifdefs = [] # lines of the open (active) IFDEFs of this file
+        self.directives = None # recorded preprocessor lines, see lex_cached
+        self.defer_directives = False # only record them, see lex_chunk
+        self.np_cache = None # see np_tables
+        self.np_lines = None # see np_newlines
+        self.fallback = None # why lex_parallel lexed here, see lex_parallel
+
+        if BasicLexer.shared_rules is None:
+            self.set_rules(BasicLexer.rules())
+            BasicLexer.shared_rules = self.rule_tables()
+        else:
+            self.use_rule_tables(BasicLexer.shared_rules)
+
+    # rule tables, compiled once by the first instance and shared read-only
+    # by all others (imports create a new BasicLexer each)
+    shared_rules = None
+
+    @staticmethod
+    def rules():
+        """the rules for set_rules, the actions are the methods below"""
         cs = CharSets()
+        operator_char = list(set([ord(c) for o in BasicLexer_operators for c in o]))
 
-        def action_whitespace(line,linenum,state,start,pos):
-            return (True, "init", pos+1)
+        return [
+            # whitespaces:
+            ("init", cs.whitespace(),                         "init"),
         
-        keyword_names = {t:1 for t in [
-                "struct","function","var","const",
-                "cast","sizeof",
-                "if","else","elif",
-                "while","for",
-                "return",
-                ]}
-        builtintype_names = {t:1 for t in [
-                "i32",
-                "float","double",
-                "u64","u32","u16","u8",
-                "void",
-                ]}
-
-        # names:
-        #   letters, digit, underscore
-        #   but cannot start with digit
+            # operators
+            ("init", operator_char,                           BasicLexer.action_operator),
+            ("oper", operator_char,                           BasicLexer.action_operator),
+            ("oper", [-1],                                    BasicLexer.action_operator_end),
         
-        def action_name(line,linenum,state,start,pos):
-            return (True, "name", start)
-        def action_name_end(line,linenum,state,start,pos):
-            value = line[start:pos]
-            if value in keyword_names:
-                self.push_token("keyword", value)
-            elif value in builtintype_names:
-                self.push_token("type", value)
-            else:
-                self.push_token("name", value)
-            return (False,"init", pos)
+            # names:
+            ("init", cs.letter() + [ord("_")],                "name"),
+            ("name", cs.letter() + cs.digit() + [ord("_")],   "name"),
+            ("name", [-1],                                    BasicLexer.action_name_end),
         
-        # separators:
-        def action_semicolon(line,linenum,state,start,pos):
-            self.push_token("semicolon", ";")
-            return (True,"init", pos+1)
-        def action_comma(line,linenum,state,start,pos):
-            self.push_token("comma", ",")
-            return (True,"init", pos+1)
-
-        # brackets:
-        def action_bracket(line,linenum,state,start,pos):
-            value = line[start:pos+1]
-            self.push_token("bracket", value)
-            return (True,"init", pos+1)
+            # separators:
+            ("init", [ord(";")],                              BasicLexer.action_semicolon),
+            ("init", [ord(",")],                              BasicLexer.action_comma),
         
-        # operators:
-        #   some are single char, some multichar.
-        #   list below is then converted into query structure
-        operators = ["==", "<", ">", "<=", ">=", "!", "!=",
-                     "&", "&&", "|","||", "%", "^", ">>", "<<",
-                     "*", "/", "~",
-                     "+", "++", "-", "--", "->", ".",
-                     "=","+=", "-=","/=","*=",
-                     "//","/*",# For comments
-                     ]
+            # numbers
+            ("init", cs.digit(),                              "num"),
+            ("num",  cs.digit() + [ord(".")],                 "num"),
+            ("num",  [-1],                                    BasicLexer.action_num_end),
         
-        operator_char = list(set([ord(c) for o in operators for c in o]))
+            # brackets
+            ("init", cs.bracket(),                            BasicLexer.action_bracket),
         
-        operator_tree = {}
-
-        for o in operators:
-            t = operator_tree
-            # traverse tree
-            for char in o:
-                c = ord(char)
-                if not c in t:
-                    t[c] = {}
-                t = t[c]
-            # place an item there
-            t[0] = o
-
-        def check_operator(last,curr):
-            """check if operator last is extensible with character curr
-            returns "extensible", "last", or "error"
-            last is string
-            curr is ord (-1 if just want to check if last is valid or not)
-            """
-            t = operator_tree
-            # traverse tree
-            for char in last:
-                c = ord(char)
-                if not c in t:
-                    return "error"
-                t = t[c]
-
-            if curr in t:
-                return "extensible"
-            elif 0 in t:
-                return "last" # 0 here means item was placed
-            else:
-                return "error"
-
-        def action_operator(line,linenum,state,start,pos):
-            last = line[start:pos]
-            curr = line[pos]
-            res = check_operator(last, ord(curr))
-
-            if res == "extensible":
-                return (True, "oper", start)
-            elif res == "last":
-                if last == "//": # comment
-                    return (False,"com",pos)
-                if last == "/*": # comment
-                    return (False,"com2",pos)
-                self.push_token("operator", last)
-                return (False, "init", pos)
-            else:
-                print(f"LexError: syntax error around operator")
-                self.mark_pos()
-                quit()
+            # strings:
+            ("init", [ord("\"")],                             "str"),
+            ("str",  [ord("\\")],                             "str_esc"),
+            ("str",  [ord("\"")],                             BasicLexer.action_string_end),
+            ("str",  cs.minus(cs.legible(), [ord("\""), ord("\\")]),    "str"),
+            ("str_esc",    [ord(c) for c in "\"\'nt\\"],                "str"),
+            ("str_esc",    [ord("x")],                                  "str_esc_h1"),
+            ("str_esc_h1", cs.hex(),                                    "str_esc_h2"),
+            ("str_esc_h2", cs.hex(),                                    "str"),
+        
+            # preprocessor:
+            ("init", [ord("#")],                             "pre"),
+            ("pre",  cs.minus(cs.all(), [ord("\n")]),        "pre"),
+            ("pre",  [ord("\n")],                            BasicLexer.action_preprocess_end),
+            # comment:
+            ("com",  cs.minus(cs.all(), [ord("\n")]),        "com"),
+            ("com",  [ord("\n")],                            "init"),
+        
+            # multiline comment
+            ("com2",  cs.minus(cs.all(), [ord("*")]),        "com2"),
+            ("com2",  [ord("*")],                            "com2_s"),
+            ("com2_s",[ord("*")],                            "com2_s"),
+            ("com2_s",[ord("/")],                            "init"),
+            ("com2_s",cs.minus(cs.all(), [ord("/"),ord("*")]),        "com2"),
+            ]
 
-        def action_operator_end(line,linenum,state,start,pos):
-            value = line[start:pos]
-            res = check_operator(value, -1) # -1 as as sentinel/dummy
-            if res == "last":
-                if value == "//": # comment
-                    return (False,"com",pos)
-                if value == "/*": # comment
-                    return (False,"com2",pos)
-                self.push_token("operator", value)
-                return (False,"init", pos)
-            else:
-                print(f"LexError: syntax error around operator")
-                self.mark_start()
-                quit()
+    # names:
+    #   letters, digit, underscore
+    #   but cannot start with digit
+    
+    def action_name_end(self,seq,state,start,pos):
+        self.push_name(seq[start:pos])
+        return (False,"init", pos)
+    
+    # separators:
+    def action_semicolon(self,seq,state,start,pos):
+        self.push_token("semicolon", ";")
+        return (True,"init", pos+1)
+    def action_comma(self,seq,state,start,pos):
+        self.push_token("comma", ",")
+        return (True,"init", pos+1)
 
-        # numbers:
-        def action_digit(line,linenum,state,start,pos):
-            return (True, "num", start)
-        def action_num(line,linenum,state,start,pos):
-            return (True, "num", start)
-        def action_num_end(line,linenum,state,start,pos):
-            value = line[start:pos]
-            
-            # check validity of number
-            parts = value.split(".")
-            if len(parts) > 2:
-                print(f"LexError: syntax error around number '{value}'")
-                l.mark_start()
-                quit()
+    # brackets:
+    def action_bracket(self,seq,state,start,pos):
+        value = seq[start:pos+1]
+        self.push_token("bracket", value)
+        return (True,"init", pos+1)
+    
+    # operators:
+    #   matched with a cursor (self.oper_node) into BasicLexer_operator_trie,
+    #   one lookup per character
+    def action_operator(self,seq,state,start,pos):
+        node = 0 if state == "init" else self.oper_node
+        nxt = BasicLexer_operator_trie.get((node, ord(seq[pos])))
+
+        if nxt is not None:
+            self.oper_node = nxt
+            return (True, "oper", start)
+        last = BasicLexer_operator_accept[node]
+        if last is not None:
+            if last == "//": # comment
+                return (False,"com",pos)
+            if last == "/*": # comment
+                return (False,"com2",pos)
+            self.push_token("operator", last)
+            return (False, "init", pos)
+        else:
+            print(f"LexError: syntax error around operator")
+            self.mark_pos()
+            quit()
 
-            self.push_token("num", value)
+    def action_operator_end(self,seq,state,start,pos):
+        value = BasicLexer_operator_accept[self.oper_node]
+        if value is not None:
+            if value == "//": # comment
+                return (False,"com",pos)
+            if value == "/*": # comment
+                return (False,"com2",pos)
+            self.push_token("operator", value)
             return (False,"init", pos)
+        else:
+            print(f"LexError: syntax error around operator")
+            self.mark_start()
+            quit()
 
-        # strings:
-        #    for now only on one line
-        def action_string(line,linenum,state,start,pos):
-            return (True, "str", start)
-        def action_string_escape(line,linenum,state,start,pos):
-            return (True, "str_esc", start)
-        def action_string_escape_h1(line,linenum,state,start,pos):
-            return (True, "str_esc_h1", start)
-        def action_string_escape_h2(line,linenum,state,start,pos):
-            return (True, "str_esc_h2", start)
-        def action_string_end(line,linenum,state,start,pos):
-            value = line[start+1:pos]
-            
-            # check string for escape sequences:
-            res = []
-            state = None
-            xval = ""
-            for c in value:
-                if state is None:
-                    if c != "\\":
-                        res.append(c)
-                    else:
-                        state = "esc"
-                elif state == "esc":
-                    d = {"n":"\n", "t":"\t", "\'":"\'", "\"": "\"","\\":"\\"}
-                    if c in d:
-                        res.append(d[c])
-                        state = None
-                    elif c == "x":
-                        state = "h1"
-                        xval = ""
-                    else:
-                        print(c, ord(c), value)
-                        assert(False)
-                elif state == "h1": # for \x
-                    xval = c
-                    state = "h2"
-                elif state == "h2": # for \x
-                    xval += c
-                    state = None
-                    res.append(chr( int(xval, 16) ))
-            
-            # join the character array back together
-            value = "".join(res)
+    # numbers:
+    def action_num_end(self,seq,state,start,pos):
+        self.push_num(seq[start:pos])
+        return (False,"init", pos)
 
-            self.push_token("str", value)
-            return (True,"init", pos+1)
-        
-        # comment:
-        #   goes from double-slash // all the way to end of line
-        def action_comment(line,linenum,state,start,pos):
-            return (True, "com", pos)
-        def action_comment_end(line,linenum,state,start,pos):
-            return (True, "init", pos)
-
-        # multiline comment:
-        #   goes from /* ... */
-        def action_comment2(line,linenum,state,start,pos):
-            return (True, "com2", pos)
-        def action_comment2_star(line,linenum,state,start,pos):
-            return (True, "com2_s", pos)
-        def action_comment2_end(line,linenum,state,start,pos):
-            return (True, "init", pos)
-        
-        # preprocessor:
-        def action_preprocess(line,linenum,state,start,pos):
-            return (True, "pre", pos)
-        def action_preprocess_end(line,linenum,state,start,pos):
-            preprocessor_exec(line,linenum)
-            return (True, "init", pos)
+    # strings:
+    #    for now only on one line
+    def action_string_end(self,seq,state,start,pos):
+        self.push_string(seq[start+1:pos])
+        return (True,"init", pos+1)
+    
+    # comment:
+    #   goes from double-slash // all the way to end of line
+    # multiline comment:
+    #   goes from /* ... */
+    # both only consist of plain transitions, see rules
+
+    # preprocessor:
+    def action_preprocess_end(self,seq,state,start,pos):
+        self.preprocessor_exec(start,pos)
+        return (True, "init", pos)
+
+    def push_name(self, value):
+        """push name, keyword or type, or the tokens of a macro"""
+        if value in self.macros:
+            # reference the tokens of the DEFINE, anchored here
+            self.sync_line(self.start)
+            self.tokens.push_import(self,self.start,len(value),self.line,
+                                   self.start-self.linestart,self.macros[value])
+            return
+        self.push_token(BasicLexer_name_kind.get(value, "name"), value)
+
+    def push_num(self, value):
+        """check validity of number, push it"""
+        parts = value.split(".")
+        if len(parts) > 2:
+            print(f"LexError: syntax error around number '{value}'")
+            self.mark_start()
+            quit()
+
+        self.push_token("num", value)
+
+    def push_string(self, value):
+        """push string, value is without quotes and still escaped
+        it is only decoded on access, see decode_string
+        """
+        self.push_token("str", None, len(value)+2)
+
+    def anchor(self, line, column):
+        """token that marks an import at line/column, parent of its tokens"""
+        table = TokenTable()
+        table.push(self,"anchor",self.start,0,line,column,"anchor")
+        return table.token(0)
+
+    def preprocessor_exec(self,start,end):
+        """execute preprocessor line seq[start:end], seq[start] is the #"""
+        if self.directives is not None:
+            self.directives.extend((len(self.tokens.kind) - len(self.tokens.imports), start, end))
+            if self.defer_directives:
+                return
+        self.sync_line(start)
+        linenum = self.line
+        i = start+1 - self.linestart # column after #
+        strip = self.seq[start+1:end]
         
-        def preprocessor_exec(line,linenum):
-            # strip beginning including first #
-            i = line.find("#")+1
-            strip = line[i:-1]
-            
-            # extract command + rest
-            j = strip.find(" ")
-            cmd = strip[:j].upper()
-            rest = strip[j+1:]
+        # extract command + rest
+        j = strip.find(" ")
+        if j < 0:
+            j = len(strip)
+        cmd = strip[:j].upper()
+        rest = strip[j+1:]
 
-            if cmd == "ECHO":
-                print("PreprocessorEcho",end=" ")
+        if cmd == "ECHO":
+            print("PreprocessorEcho",end=" ")
+            self.mark_line(linenum)
+        elif cmd == "IMPORT":
+            filename = rest.strip()
+            isLib = False
+            if filename.startswith("\"") and filename.endswith("\""):
+                filename = filename[1:-1]
+            elif filename.startswith("<") and filename.endswith(">"):
+                filename = filename[1:-1]
+                isLib = True
+                assert(False and "library not implemented yet")
+            else:
+                print(f"LexError: import expects \"path\" or <library>, got '{filename}'.")
                 self.mark_line(linenum)
-            elif cmd == "IMPORT":
-                anchor_token = Token(self,"anchor","anchor",linenum,i,self.anchor_token)
-                sublex = BasicLexer(self,anchor_token)
-                
-                filename = rest.strip()
-                isLib = False
-                if filename.startswith("\"") and filename.endswith("\""):
-                    filename = filename[1:-1]
-                elif filename.startswith("<") and filename.endswith(">"):
-                    filename = filename[1:-1]
-                    isLib = True
-                    assert(False and "library not implemented yet")
+                quit()
+
+            ddir, _ = os.path.split(self.filename)
+            fname = os.path.join(ddir, filename)
+            path = os.path.realpath(fname)
+            
+            if self.pending is not None:
+                # streaming: no cache, the import is lexed when the stream gets there
+                anchor_token = self.anchor(linenum,i)
+                sublex = BasicLexer(self,anchor_token,self.compiled,self.engine)
+                self.push_segment(self.import_iter(sublex, fname, path, linenum))
+                self.jump = end # continue after the import, it may define macros
+            elif path in self.import_once:
+                pass # already imported, and marked with ONCE
+            elif path in self.import_cache and len(self.macros) == 0:
+                # reuse the tokens, anchored here
+                self.tokens.push_import(self,start+1,end-start-1,linenum,i,self.import_cache[path])
+            else:
+                # tokens only depend on the file if there are no macros
+                clean = (len(self.macros) == 0)
+                anchor_token = self.tokens.push_import(self,start+1,end-start-1,linenum,i,None)
+                sublex = BasicLexer(self,anchor_token,self.compiled,self.engine)
+                seq = self.import_read(fname, linenum)
+                if self.cache_dir is None or not clean:
+                    tokens = sublex.lex(seq,fname)
                 else:
-                    print(f"LexError: import expects \"path\" or <library>, got '{filename}'.")
-                    self.mark_line(linenum)
-                    quit()
+                    tokens = sublex.lex_cached(seq,fname)
+                self.tokens.imports[anchor_token.row] = tokens
+                if clean and len(self.macros) == 0:
+                    self.import_cache[path] = tokens
 
-                ddir, _ = os.path.split(self.filename)
-                fname = os.path.join(ddir, filename)
-                
-                try:
-                    with open(fname,"r") as f:
-                        seq = f.read()
-                except:
-                    print(f"LexError: import file not found.")
-                    self.mark_line(linenum)
-                    quit()
-                
-                tokens = sublex.lex(seq,fname)
-                self.tokens += tokens
+        elif cmd == "ONCE":
+            # further imports of this file are ignored
+            self.import_once.add(os.path.realpath(self.filename))
 
-            elif cmd == "DEFINE":
-                self.mark_line(linenum)
-                assert(False and "not implemented")
-            elif cmd == "UNDEFINE":
+        elif cmd == "DEFINE":
+            m = BasicLexer_name.match(rest)
+            if m is None or not rest[m.end():m.end()+1] in ["", " "]:
+                print(f"PreprocessorError: DEFINE expects a name.")
                 self.mark_line(linenum)
-                assert(False and "not implemented")
-            elif cmd == "IFDEF":
+                quit()
+            # lex the rest of the line, the uses of the macro reference
+            # these tokens (see push_name)
+            body = BasicLexer(self,self.anchor_token,self.compiled,self.engine)
+            body.parent = self.parent # diagnostics like for this file
+            body.lex_begin(self.seq, self.filename)
+            body.line = linenum
+            body.linestart = body.linepos = self.linestart
+            body.pos = start+1+j+1+m.end()
+            # the other engines may lex past end, the line is short anyway
+            Lexer.lex_run(body, end+1 if end < len(self.seq) else None)
+            self.macros[m.group()] = body.tokens
+        elif cmd == "UNDEFINE":
+            name = rest.strip()
+            if BasicLexer_name.fullmatch(name) is None:
+                print(f"PreprocessorError: UNDEFINE expects a name.")
                 self.mark_line(linenum)
-                assert(False and "not implemented")
-            elif cmd == "ENDIF":
+                quit()
+            self.macros.pop(name, None)
+        elif cmd == "IFDEF":
+            name = rest.strip()
+            if BasicLexer_name.fullmatch(name) is None:
+                print(f"PreprocessorError: IFDEF expects a name.")
                 self.mark_line(linenum)
-                assert(False and "not implemented")
+                quit()
+            if name in self.macros:
+                self.ifdefs.append(linenum)
             else:
-                print(f"PreprocessorError: unknown command {cmd}.")
+                # skip to the matching ENDIF line, without lexing
+                depth = 1
+                for m in BasicLexer_ifdef.finditer(self.seq, end):
+                    depth += 1 if m.group(1) is not None else -1
+                    if depth == 0:
+                        break
+                if depth > 0:
+                    print(f"PreprocessorError: IFDEF without ENDIF.")
+                    self.mark_line(linenum)
+                    quit()
+                eol = self.seq.find("\n", m.end())
+                self.jump = len(self.seq) if eol < 0 else eol
+        elif cmd == "ENDIF":
+            if len(self.ifdefs) == 0:
+                print(f"PreprocessorError: ENDIF without IFDEF.")
                 self.mark_line(linenum)
                 quit()
+            self.ifdefs.pop()
+        else:
+            print(f"PreprocessorError: unknown command {cmd}.")
+            self.mark_line(linenum)
+            quit()
 
-        self.set_rules([
-            # whitespaces:
-            ("init", cs.whitespace(),                         action_whitespace),
-            
-            # operators
-            ("init", operator_char,                           action_operator),
-            ("oper", operator_char,                           action_operator),
-            ("oper", [-1],                                    action_operator_end),
-            
-            # names:
-            ("init", cs.letter() + [ord("_")],                action_name),
-            ("name", cs.letter() + cs.digit() + [ord("_")],   action_name),
-            ("name", [-1],                                    action_name_end),
-            
-            # separators:
-            ("init", [ord(";")],                              action_semicolon),
-            ("init", [ord(",")],                              action_comma),
-            
-            # numbers
-            ("init", cs.digit(),                              action_digit),
-            ("num",  cs.digit() + [ord(".")],                 action_num),
-            ("num",  [-1],                                    action_num_end),
-            
-            # brackets
-            ("init", cs.bracket(),                            action_bracket),
-            
-            # strings:
-            ("init", [ord("\"")],                             action_string),
-            ("str",  [ord("\\")],                             action_string_escape),
-            ("str",  [ord("\"")],                             action_string_end),
-            ("str",  cs.minus(cs.legible(), [ord("\""), ord("\\")]),    action_string),
-            ("str_esc",    [ord(c) for c in "\"\'nt\\"],                action_string),
-            ("str_esc",    [ord("x")],                                  action_string_escape_h1),
-            ("str_esc_h1", cs.hex(),                                    action_string_escape_h2),
-            ("str_esc_h2", cs.hex(),                                    action_string),
-            
-            # preprocessor:
-            ("init", [ord("#")],                             action_preprocess),
-            ("pre",  cs.minus(cs.all(), [ord("\n")]),        action_preprocess),
-            ("pre",  [ord("\n")],                            action_preprocess_end),
-            # comment:
-            ("com",  cs.minus(cs.all(), [ord("\n")]),        action_comment),
-            ("com",  [ord("\n")],                            action_comment_end),
-            
-            # multiline comment
-            ("com2",  cs.minus(cs.all(), [ord("*")]),        action_comment2),
-            ("com2",  [ord("*")],                            action_comment2_star),
-            ("com2_s",[ord("*")],                            action_comment2_star),
-            ("com2_s",[ord("/")],                            action_comment2_end),
-            ("com2_s",cs.minus(cs.all(), [ord("/"),ord("*")]),        action_comment2),
-            ])
+    def lex_cached(self, seq, filename):
+        """like lex, but the tokens are loaded from the token cache in
+        self.cache_dir if seq was lexed before, else stored there.
+
+        The cache file name is a hash of seq, the cache version and the rules
+        (see token_cache_key), so it is invalid once any of them changes.
+        The preprocessor lines are recorded and executed again on load,
+        with their imports.
+        """
+        self.lex_begin(seq, filename)
+        if len(self.macros) > 0:
+            self.lex_engine() # the tokens depend on the macros
+            return self.tokens
+        key = token_cache_key(seq)
+        path = os.path.join(self.cache_dir, key.hex() + ".tok")
+
+        data = token_cache_load(path, key)
+        if data is not None:
+            self.resume(self.replay(*data))
+            return self.tokens
+
+        self.directives = array('i')
+        self.lex_engine()
+        if len(self.macros) == 0 and not lex_uses_macros(seq):
+            token_cache_store(path, key, self.tokens, self.directives)
+        self.directives = None
+        return self.tokens
+
+    def replay(self, columns, directives):
+        """push token rows (see TokenTable.push_rows), and execute the recorded
+        preprocessor lines (row, start, end) in between.
+        The rows were lexed without macros. If a preprocessor line defines one
+        or skips lines, the rest is dropped: returns the position to lex from
+        (see resume), else None.
+        """
+        rows = 0
+        for d in range(0, len(directives), 3):
+            row, start, end = directives[d:d+3]
+            self.tokens.push_rows(self, columns, rows, row)
+            rows = row
+            self.preprocessor_exec(start, end)
+            if self.jump is not None or len(self.macros) > 0:
+                return end if self.jump is None else self.jump
+        self.tokens.push_rows(self, columns, rows, len(columns[0]))
+        return None
+
+    def resume(self, pos):
+        """lex the rest from pos, if replay stopped there"""
+        if pos is None:
+            return
+        self.jump = None
+        self.state = "init"
+        self.pos = pos
+        self.lex_engine()
+
+    def lex_parallel(self, seq, filename, workers = None):
+        """like lex, but a large seq is split into chunks of whole lines that
+        are lexed in a process pool (see lex_chunk).
+
+        At the end of a line, the state is always init, or com2 inside /* */.
+        Every chunk is lexed as if it started in init. If the chunk before
+        ended in com2, that result is dropped and the chunk is lexed here,
+        from the end of the comment. Chunks that fail are lexed here again,
+        for the diagnostics. Preprocessor lines are executed here, in order.
+
+        There are about 2 chunks per worker, of at least Lexer_parallel_chunk
+        characters. seq is lexed here (like lex) if there are less than 2
+        workers or chunks, or if it uses macros: self.fallback is the reason
+        then, else None.
+        """
+        self.lex_begin(seq, filename)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        size = max(Lexer_parallel_chunk, len(seq) // (2*workers))
+        chunks = lex_chunks(seq, size)
+        self.fallback = None
+        if workers < 2:
+            self.fallback = "one worker"
+        elif len(chunks) < 2:
+            self.fallback = f"one chunk ({len(seq)} characters)"
+        elif lex_uses_macros(seq):
+            self.fallback = "macros"
+        if self.fallback is not None:
+            self.lex_engine()
+            return self.tokens
+
+        pos = None
+        jobs = [(seq[a:b], a, line, self.compiled, self.engine) for a,b,line in chunks]
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            for (a,b,line),res in zip(chunks, pool.map(lex_chunk, jobs)):
+                columns, directives, state = res
+                end = None if b == len(seq) else b
+                if self.state == "com2":
+                    p = seq.find("*/", a, b)
+                    stop = b if p < 0 else p
+                    if Lexer_nonlatin.search(seq, a, stop) is not None:
+                        self.lex_compiled(a, end) # quits with the error
+                    elif p < 0:
+                        continue # whole chunk is in the comment
+                    else:
+                        self.state = "init"
+                        self.lex_compiled(p+2, end)
+                elif columns is None:
+                    self.state = "init"
+                    self.lex_compiled(a, end) # quits with the error
+                else:
+                    pos = self.replay(columns, directives)
+                    if pos is not None:
+                        break # an import defined macros, lex the rest here
+                    self.state = state
+        self.resume(pos)
+        return self.tokens
+
+    def relex(self, tokens, seq, filename, first, last, text):
+        """re-lex after an edit: lines first:last of seq are replaced by text.
+        tokens: TokenTable of seq (from lex of a BasicLexer)
+        returns the TokenTable of the new sequence (self.seq).
+
+        Right after a token, the state is always init. So lexing restarts at
+        the end of the last token that ends before the edit (a token that
+        ends right at the edit can continue into it), and stops at the first new
+        token after the edit that is also an old token (same kind, length and
+        moved offset): from there on, the old tokens are the same.
+        The tokens before and after are copied (moved), with their imports.
+        Preprocessor lines after that point are not executed again.
+        """
+        es = lex_line_offset(seq, first, tokens)
+        ee = lex_line_offset(seq, last, tokens)
+        new = seq[:es] + text + seq[ee:]
+        delta = len(text) - (ee - es)
+        dline = text.count("\n") - seq.count("\n", es, ee)
+        # the rest of line last follows the last line of text
+        dcolumn = len(text) - (text.rfind("\n") + 1)
+
+        self.lex_begin(new, filename)
+        if (len(tokens.chains) > 0 and len(tokens.chains[0][0].macros) > 0
+                or lex_uses_macros(seq) or lex_uses_macros(text)):
+            # macros change the tokens anywhere after their DEFINE
+            self.lex_engine()
+            return self.tokens
+        if len(tokens.chains) > 0:
+            # imports before the edit are still imported, reuse their tokens
+            old = tokens.chains[0][0]
+            self.import_cache = old.import_cache
+            imported = lex_imported_paths(tokens, es, old.import_cache)
+            self.import_once = set(p for p in old.import_once
+                                   if p == os.path.realpath(filename) or p in imported)
+
+        # keep all rows that end before the edit
+        offset = np.frombuffer(tokens.offset, dtype=np.int32)
+        ends = offset + np.frombuffer(tokens.length, dtype=np.int32)
+        a = int(np.searchsorted(ends, es, "left"))
+        self.tokens.copy_rows(self, tokens, 0, a)
+        if a > 0:
+            self.pos = self.linepos = int(ends[a-1])
+            self.line = tokens.line[a-1]
+            self.linestart = tokens.offset[a-1] - tokens.column[a-1]
+        prefix = self.tokens
+        restart = (self.line, self.linestart, self.linepos)
+
+        # lex into a separate table, in growing steps, until the old tokens
+        # after the edit (from b) are found again
+        self.tokens = TokenTable()
+        self.directives = array('i')
+        self.defer_directives = True
+        b = int(np.searchsorted(offset, ee, "left"))
+        j = b
+        k = 0
+        sync = None
+        step = 256
+        while sync is None:
+            stop = self.pos + step
+            if stop >= len(new):
+                stop = None
+            self.lex_engine(stop)
+            t = self.tokens
+            old_offset = tokens.offset
+            while k < len(t.kind):
+                q = t.offset[k]
+                while j < len(old_offset) and old_offset[j] + delta < q:
+                    j += 1
+                if (j < len(old_offset) and old_offset[j] + delta == q
+                        and tokens.kind[j] == t.kind[k] and tokens.length[j] == t.length[k]):
+                    sync = (k, j)
+                    break
+                k += 1
+            if stop is None:
+                break
+            step *= 2
+
+        relexed = [t.kind, t.offset, t.length, t.line, t.column]
+        directives = self.directives
+        self.tokens = prefix
+        self.directives = None
+        self.defer_directives = False
+        self.line, self.linestart, self.linepos = restart # for the directives
+        if sync is None:
+            self.resume(self.replay(relexed, directives))
+        else:
+            k, j = sync
+            d = 0
+            while d < len(directives) and directives[d] <= k:
+                d += 3
+            relexed = [c[:k+1] for c in relexed]
+            pos = self.replay(relexed, directives[:d])
+            if pos is None:
+                self.tokens.copy_rows(self, tokens, j+1, len(offset), delta, dline,
+                                      dcolumn, last)
+            self.resume(pos)
+        return self.tokens
+
+    def import_read(self, fname, linenum):
+        """read the file of an import on line linenum"""
+        try:
+            with open(fname,"r") as f:
+                return f.read()
+        except:
+            print(f"LexError: import file not found.")
+            self.mark_line(linenum)
+            quit()
+
+    def import_iter(self, sublex, fname, path, linenum):
+        """stream the tokens of an import, the file is only read once needed"""
+        if path in self.import_once:
+            return
+        seq = self.import_read(fname, linenum)
+        yield from sublex.iter_tokens(seq, fname)
+
+    def lex_engine(self, end = None):
+        jumped = super().lex_engine(end)
+        if end is None and not jumped and len(self.ifdefs) > 0:
+            print(f"PreprocessorError: IFDEF without ENDIF.")
+            self.mark_line(self.ifdefs[-1])
+            quit()
+        return jumped
+
+    def lex_run(self, end = None):
+        if self.engine == "regex":
+            self.lex_regex(end)
+        elif self.engine == "numpy":
+            self.lex_numpy(end)
+        else:
+            super().lex_run(end)
+
+    def lex_fallback(self, start, err):
+        """the token at start is broken, the first bad character is at err
+        let the FSM find the same error from start, to the end of the line of err
+        """
+        seq = self.seq
+        self.state = "init"
+        eol = seq.find("\n", err)
+        self.lex_compiled(start, None if eol < 0 else eol+1)
+        print(f"LexError: unexpected character {ord(seq[start])} '{seq[start]}'")
+        self.pos = start
+        self.mark_pos()
+        quit()
+
+    def np_tables(self):
+        """vectorized tables for lex_numpy, built once per sequence:
+        classes of all characters (BasicLexer_classes), and for every offset
+        the next offset (or len(seq)) that is not whitespace, not part of a
+        name, not part of a number, or a character above 255.
+        """
+        if self.np_cache is None:
+            codes = np_codes(self.seq)
+            cls = BasicLexer_classes[codes]
+            end = np.ones(1, dtype=bool) # sentinel at len(seq)
+            ws = (cls == NPClass_ws) | (cls == NPClass_newline)
+            name = (cls == NPClass_letter) | (cls == NPClass_digit)
+            num = (cls == NPClass_digit) | (codes == ord("."))
+            self.np_cache = (
+                memoryview(cls),
+                memoryview(np_next(np.concatenate([~ws, end]))),
+                memoryview(np_next(np.concatenate([~name, end]))),
+                memoryview(np_next(np.concatenate([~num, end]))),
+                memoryview(np_next(np.concatenate([codes == 256, end]))),
+                )
+        return self.np_cache
+
+    def np_newlines(self):
+        """offsets of all newlines in seq, after a -1 (before line 0)
+        built once per sequence, see push_columns"""
+        if self.np_lines is None:
+            nl = np.flatnonzero(np_codes(self.seq) == ord("\n"))
+            self.np_lines = np.concatenate([np.full(1, -1, dtype=nl.dtype), nl])
+        return self.np_lines
+
+    def push_columns(self, kinds, offsets, lengths):
+        """push tokens in bulk, and clear the lists
+        kinds: index into TokenTable_kinds, offsets and lengths in seq
+        (values are the slices of seq). line and column are computed for
+        all tokens at once, with the newline offsets (see sync_line).
+        """
+        if len(kinds) == 0:
+            return
+        nl = self.np_newlines()
+        off = np.array(offsets, dtype=np.int64)
+        base = np.searchsorted(nl, self.linepos)
+        idx = np.searchsorted(nl, off)
+        line = (idx - base + self.line).astype(np.int32)
+        column = (off - np.where(idx > base, nl[idx-1] + 1, self.linestart)).astype(np.int32)
+        if off[-1] > self.linepos:
+            self.line = int(line[-1])
+            self.linestart = int(off[-1] - column[-1])
+            self.linepos = int(off[-1])
+
+        columns = [array('i', kinds), array('i', offsets), array('i', lengths), array('i'), array('i')]
+        columns[3].frombytes(line.tobytes())
+        columns[4].frombytes(column.tobytes())
+        self.tokens.push_rows(self, columns, 0, len(kinds))
+        kinds.clear()
+        offsets.clear()
+        lengths.clear()
+
+    def lex_numpy(self, end = None):
+        """lex with the tables of np_tables: whitespace, names and numbers are
+        skipped with one lookup, so there is only python work per token.
+        strings, comments and preprocessor lines are found with str.find/match.
+        tokens are collected as columns, and pushed in bulk (push_columns)
+        before anything that needs the table or the line.
+        errors are reproduced with the FSM, see lex_fallback.
+        stops after the first token that reaches end (if not None)
+        """
+        seq = self.seq
+        n = len(seq)
+        cls, nonws, name_end, num_end, bad = self.np_tables()
+        trie = BasicLexer_operator_trie
+        accept = BasicLexer_operator_accept
+        stop = n + 1 if end is None else end
+        macros = self.macros
+        name_kind = BasicLexer_name_kind_id
+        kinds, offsets, lengths = [], [], []
+        push = self.push_columns
+
+        i = self.pos
+        while True:
+            i = nonws[i]
+            if i >= n:
+                break
+            self.start = i
+            k = cls[i]
+            if k == NPClass_letter:
+                j = name_end[i]
+                value = seq[i:j]
+                if value in macros:
+                    push(kinds, offsets, lengths)
+                    self.push_name(value)
+                else:
+                    kinds.append(name_kind.get(value, TokenTable_name))
+                    offsets.append(i)
+                    lengths.append(j-i)
+            elif k == NPClass_digit:
+                j = num_end[i]
+                if seq.count(".", i, j) > 1:
+                    push(kinds, offsets, lengths)
+                    self.push_num(seq[i:j]) # reports the error
+                else:
+                    kinds.append(TokenTable_num)
+                    offsets.append(i)
+                    lengths.append(j-i)
+            elif k == NPClass_bracket:
+                j = i+1
+                kinds.append(TokenTable_bracket)
+                offsets.append(i)
+                lengths.append(1)
+            elif k == NPClass_semicolon:
+                j = i+1
+                kinds.append(TokenTable_semicolon)
+                offsets.append(i)
+                lengths.append(1)
+            elif k == NPClass_comma:
+                j = i+1
+                kinds.append(TokenTable_comma)
+                offsets.append(i)
+                lengths.append(1)
+            elif k == NPClass_quote:
+                m = BasicLexer_string.match(seq, i)
+                if m is None:
+                    push(kinds, offsets, lengths)
+                    self.lex_fallback(i, i)
+                j = m.end()
+                kinds.append(TokenTable_str)
+                offsets.append(i)
+                lengths.append(j-i)
+            elif k == NPClass_hash:
+                push(kinds, offsets, lengths)
+                j = seq.find("\n", i)
+                if j < 0:
+                    j = n
+                if bad[i] < j:
+                    self.lex_fallback(i, bad[i])
+                self.preprocessor_exec(i, j)
+                if self.jump is not None:
+                    self.pos = self.jump
+                    return
+            elif k == NPClass_operator:
+                node = 0
+                j = i
+                while j < n:
+                    nxt = trie.get((node, ord(seq[j])))
+                    if nxt is None:
+                        break
+                    node = nxt
+                    j += 1
+                value = accept[node]
+                if value is None:
+                    push(kinds, offsets, lengths)
+                    self.lex_fallback(i, j)
+                elif value == "//":
+                    j = seq.find("\n", j)
+                    if j < 0:
+                        j = n
+                    if bad[i] < j:
+                        push(kinds, offsets, lengths)
+                        self.lex_fallback(i, bad[i])
+                elif value == "/*":
+                    e = seq.find("*/", j)
+                    j = n if e < 0 else e+2
+                    if bad[i] < j:
+                        push(kinds, offsets, lengths)
+                        self.lex_fallback(i, bad[i])
+                    if e < 0:
+                        self.state = "com2" # not closed, like the FSM
+                else:
+                    kinds.append(TokenTable_operator)
+                    offsets.append(i)
+                    lengths.append(j-i)
+            else:
+                push(kinds, offsets, lengths)
+                self.lex_fallback(i, i)
+
+            i = j
+            if i >= stop:
+                break
+        push(kinds, offsets, lengths)
+        self.pos = i
+
+    def lex_regex(self, end = None):
+        """lex with BasicLexer_regex: finditer over the buffer from self.pos,
+        the regex engine consumes whole tokens/comments at once.
+        tokens are pushed in bulk, as in lex_numpy.
+        stops after the first token that reaches end (if not None)
+        """
+        seq = self.seq
+        comment = None # comment that ended right before the current match
+        stop = len(seq) + 1 if end is None else end
+        macros = self.macros
+        name_kind = BasicLexer_name_kind_id
+        group_kind = BasicLexer_regex_kind
+        kinds, offsets, lengths = [], [], []
+        push = self.push_columns
+        for m in BasicLexer_regex.finditer(seq, self.pos):
+            kind = m.lastgroup
+            self.pos = m.end()
+            if kind == "ws":
+                continue
+            if kind == "com" or kind == "com2":
+                comment = m
+                continue
+
+            start, end = m.span()
+            self.start = start
+            k = group_kind.get(kind)
+            if k is not None:
+                kinds.append(k)
+                offsets.append(start)
+                lengths.append(end-start)
+            elif kind == "name":
+                value = m.group()
+                if value in macros:
+                    push(kinds, offsets, lengths)
+                    self.push_name(value)
+                else:
+                    kinds.append(name_kind.get(value, TokenTable_name))
+                    offsets.append(start)
+                    lengths.append(end-start)
+            elif kind == "num":
+                if seq.count(".", start, end) > 1:
+                    push(kinds, offsets, lengths)
+                    self.push_num(m.group()) # reports the error
+                else:
+                    kinds.append(TokenTable_num)
+                    offsets.append(start)
+                    lengths.append(end-start)
+            elif kind == "pre":
+                push(kinds, offsets, lengths)
+                # the match stops before a bad character, check the line
+                eol = seq.find("\n", start)
+                bad = Lexer_nonlatin.search(seq, start, len(seq) if eol < 0 else eol)
+                if bad is not None:
+                    self.lex_fallback(start, bad.start())
+                self.preprocessor_exec(start,end)
+                if self.jump is not None:
+                    self.pos = self.jump
+                    return
+            elif kind == "error":
+                push(kinds, offsets, lengths)
+                # let the FSM find the same error, from this token start
+                # or the comment that was cut short before it.
+                # (no token continues over the end of the line)
+                end = start
+                if (comment is not None and comment.end() == start
+                        and ord(seq[start]) > 255):
+                    text = comment.group()
+                    if text[1] == "/" or len(text) < 4 or text[-2:] != "*/":
+                        start = comment.start()
+                self.lex_fallback(start, end)
+
+            if self.pos >= stop:
+                push(kinds, offsets, lengths)
+                return
+        push(kinds, offsets, lengths)
+        self.pos = len(seq)
+        if comment is not None and comment.end() == len(seq):
+            text = comment.group()
+            if text[1] == "*" and (len(text) < 4 or text[-2:] != "*/"):
+                self.state = "com2" # not closed, like the FSM
+
+
+def lex_line_offset(seq, line, tokens = None):
+    """offset of the start of line in seq (len(seq) if there are fewer lines)
+    tokens: TokenTable of seq, optional. the search starts at the line of the
+    last token before line, instead of the start of seq.
+    """
+    pos = 0
+    l = 0
+    if tokens is not None:
+        r = int(np.searchsorted(np.frombuffer(tokens.line, dtype=np.int32), line, "right")) - 1
+        if r >= 0:
+            pos = tokens.offset[r] - tokens.column[r]
+            l = tokens.line[r]
+    for _ in range(line - l):
+        pos = seq.find("\n", pos) + 1
+        if pos == 0:
+            return len(seq)
+    return pos
+
+def lex_imported_paths(tokens, end, import_cache):
+    """real paths of all files imported by the anchor rows of tokens before
+    offset end, and by their imports. import_cache: realpath -> TokenTable"""
+    path_of = {id(table):path for path,table in import_cache.items()}
+    paths = set()
+    todo = [(tokens, end)]
+    while len(todo) > 0:
+        t, e = todo.pop()
+        for row, table in t.imports.items():
+            if table is None or t.offset[row] >= e:
+                continue
+            if id(table) in path_of: # else the tokens of a macro
+                paths.add(path_of[id(table)])
+            todo.append((table, sys.maxsize))
+    return paths
+
+# lex_parallel: minimal number of characters per chunk
+Lexer_parallel_chunk = 1 << 16
+
+# characters the lexer rules do not cover
+Lexer_nonlatin = re.compile(r'[^\x00-\xff]')
+
+def lex_chunks(seq, size):
+    """split seq into chunks of whole lines, of at least size characters
+    returns list of (start, end, line of start)
+    """
+    chunks = []
+    a = 0
+    line = 0
+    n = len(seq)
+    while a < n:
+        b = seq.find("\n", a + size) + 1
+        if b <= 0:
+            b = n
+        chunks.append((a, b, line))
+        line += seq.count("\n", a, b)
+        a = b
+    return chunks
+
+def lex_chunk(job):
+    """worker of lex_parallel: lex a chunk of whole lines from state init
+
+    job: (seq, offset of seq in the file, line of seq in the file, compiled, engine)
+    returns (columns, directives, state) with offsets and lines in the file,
+    state at the end of the chunk. columns is None if lexing failed.
+    preprocessor lines are only recorded.
+    """
+    seq, base, line0, compiled, engine = job
+    l = BasicLexer(None, None, compiled, engine)
+    l.directives = array('i')
+    l.defer_directives = True
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            tokens = l.lex(seq, "")
+    except SystemExit:
+        return None, None, None
+
+    offset = array('i', [o + base for o in tokens.offset])
+    line = array('i', [i + line0 for i in tokens.line])
+    directives = l.directives
+    for d in range(0, len(directives), 3):
+        directives[d+1] += base
+        directives[d+2] += base
+    return [tokens.kind, offset, tokens.length, line, tokens.column], directives, l.state
+
+# bump if the token cache format or the meaning of its rows change
+BasicLexer_cache_version = 1
+
+# header: magic, key, itemsize of array('i'), little endian, rows, directives
+BasicLexer_cache_header = struct.Struct("<4s32sBBII")
+
+def token_cache_key(seq):
+    """sha256 of cache version, rules and seq"""
+    h = hashlib.sha256()
+    h.update(str(BasicLexer_cache_version).encode())
+    h.update(token_cache_rules_hash())
+    h.update(seq.encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+BasicLexer_rules_hash = None
+
+def token_cache_rules_hash():
+    """hash of everything that decides which tokens are produced"""
+    global BasicLexer_rules_hash
+    if BasicLexer_rules_hash is None:
+        rules = []
+        for state,characters,action in BasicLexer.rules():
+            if not isinstance(action, str):
+                action = action.__name__
+            rules.append((state, characters, action))
+        desc = repr((rules, BasicLexer_keywords, BasicLexer_types,
+                     BasicLexer_operators, TokenTable_kinds))
+        BasicLexer_rules_hash = hashlib.sha256(desc.encode()).digest()
+    return BasicLexer_rules_hash
+
+def token_cache_load(path, key):
+    """returns (columns, directives) from cache file path, or None if there is
+    no valid file for key"""
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                header = BasicLexer_cache_header
+                if len(m) < header.size:
+                    return None
+                magic, k, itemsize, little, rows, ndir = header.unpack_from(m, 0)
+                if (magic != b"PCTK" or k != key or itemsize != array('i').itemsize
+                        or little != (sys.byteorder == "little")
+                        or len(m) != header.size + itemsize*(5*rows + 3*ndir)):
+                    return None
+                pos = header.size
+                columns = []
+                for _ in range(5):
+                    a = array('i')
+                    a.frombytes(m[pos:pos+itemsize*rows])
+                    columns.append(a)
+                    pos += itemsize*rows
+                directives = array('i')
+                directives.frombytes(m[pos:pos+itemsize*3*ndir])
+                return columns, directives
+    except (OSError, ValueError):
+        return None
+
+def token_cache_store(path, key, tokens, directives):
+    """store the token rows of TokenTable tokens (without import anchors)
+    and the directives at path, atomically"""
+    keep = [k != TokenTable_anchor for k in tokens.kind]
+    columns = [tokens.kind, tokens.offset, tokens.length, tokens.line, tokens.column]
+    if len(tokens.imports) > 0:
+        columns = [array('i', (v for v,k in zip(c, keep) if k)) for c in columns]
+    rows = len(columns[0])
+
+    header = BasicLexer_cache_header.pack(b"PCTK", key, array('i').itemsize,
+            sys.byteorder == "little", rows, len(directives)//3)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(tmp, "wb") as f:
+            f.write(header)
+            for c in columns:
+                f.write(c.tobytes())
+            f.write(directives.tobytes())
+        os.replace(tmp, path)
+    except OSError:
+        # the cache is only an optimization
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
 
 def main(argv):
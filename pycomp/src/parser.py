@@ -78,19 +78,118 @@
 
 import sys
 import os
+import gc
+import io
+import contextlib
+import pickle
+import copyreg
+import weakref
+import multiprocessing
+import concurrent.futures
 from collections import deque
 import lexer
 import math
 import numpy as np # for c style value calculations
 
+# kinds of PTNode
+PTNode_list = 0         # no tokens, one list (shell around a list)
+PTNode_bracket = 1      # open and close bracket, one list
+PTNode_delimiter = 2    # n delimiter tokens, n+1 lists
+
+def PTNode_first(l):
+    """first token of the elements of list l (None if they have no tokens)"""
+    for c in l:
+        if c.isToken:
+            return c
+        if c.first is not None:
+            return c.first
+    return None
+
+def PTNode_last(l):
+    """last token of the elements of list l (None if they have no tokens)"""
+    for c in reversed(l):
+        if c.isToken:
+            return c
+        if c.last is not None:
+            return c.last
+    return None
+
+class PTNode:
+    """Node of a parse tree pt
+    tokens: consumed tokens
+    lists: list of list of Nodes
+    kind: see PTNode_*, from the tokens
+    first, last: first and last token of the node, in token order
+        (None if the node has no tokens). Set when the node is built,
+        from the elements, so the nodes below must be complete.
+    Leafs of the pt are the Tokens. Check with pt.isToken.
+    """
+    __slots__ = ("kind", "tokens", "lists", "first", "last")
+    isToken = False
+
+    def __init__(self, tokens, lists):
+        self.tokens = tokens
+        self.lists = lists
+        if len(tokens) == 0:
+            self.kind = PTNode_list
+        elif tokens[0].name == "bracket":
+            self.kind = PTNode_bracket
+        else:
+            self.kind = PTNode_delimiter
+        # token order: brackets around the list, delimiters between the
+        # lists. So only the ends need to be looked at.
+        if self.kind == PTNode_bracket:
+            self.first = tokens[0]
+            self.last = tokens[-1]
+        elif self.kind == PTNode_delimiter:
+            self.first = PTNode_first(lists[0])
+            if self.first is None:
+                self.first = tokens[0]
+            self.last = PTNode_last(lists[-1])
+            if self.last is None:
+                self.last = tokens[-1]
+        else:
+            self.first = None
+            self.last = None
+            for l in lists:
+                self.first = PTNode_first(l)
+                if self.first is not None:
+                    break
+            for l in reversed(lists):
+                self.last = PTNode_last(l)
+                if self.last is not None:
+                    break
+
+    def __repr__(self):
+        # PTNode([tokens], [[elements], ...]), without recursion
+        out = []
+        stack = [self]
+        while len(stack) > 0:
+            x = stack.pop()
+            if type(x) is str:
+                out.append(x)
+            elif x.isToken:
+                out.append(repr(x))
+            else:
+                items = [f"PTNode({list(x.tokens)}, ["]
+                for i,l in enumerate(x.lists):
+                    items.append("[" if i == 0 else ", [")
+                    for k,el in enumerate(l):
+                        if k > 0:
+                            items.append(", ")
+                        items.append(el)
+                    items.append("]")
+                items.append("])")
+                stack.extend(reversed(items))
+        return "".join(out)
+
 class Parser():
     """Parses tokens into ParseTree pt
     
     Method: sequential application of scanning rules.
     
-    Node of pt: (isToken, payload)
-    if token:       payload = Token
-    else (pt node): payload = (consumed tokens, list of list of Nodes)
+    Node of pt: Token or PTNode
+    PTNode has the consumed tokens, and list of list of Nodes
     
     Idea: rules are applied on a list of Nodes
 
@@ -102,27 +201,42 @@ class Parser():
     def parse_apply_rule(self, rule, pt):
         """traversal impl for parse"""
         # Traversal bottom up (post order)
+        # with a stack of (node, its elements, new elements so far),
+        # instead of recursion: the pt can be deep
         
-        isToken, payload = pt
-        if not isToken:
-            tokens, listoflists = payload
-            # recurse
-            listoflists = [[self.parse_apply_rule(rule, i) for i in l] for l in listoflists]
-            # post order
-            listoflists = [rule(l) for l in listoflists]
-            
-            # reconstruct pt node
-            return (False,(tokens, listoflists))
-        else:
+        if pt.isToken:
             return pt # just return token
+        stack = [(pt, iter([i for l in pt.lists for i in l]), [])]
+        while True:
+            node, elements, new = stack[-1]
+            for i in elements:
+                if i.isToken:
+                    new.append(i)
+                else:
+                    stack.append((i, iter([j for l in i.lists for j in l]), []))
+                    break
+            else:
+                stack.pop()
+                # post order
+                listoflists = []
+                k = 0
+                for l in node.lists:
+                    listoflists.append(rule(new[k:k+len(l)]))
+                    k += len(l)
+                
+                # reconstruct pt node
+                pt = PTNode(node.tokens, listoflists)
+                if len(stack) == 0:
+                    return pt
+                stack[-1][2].append(pt)
 
     def parse(self,tokens):
         """
-        Input: tokens from lexer
+        Input: tokens from lexer, a list or any iterable (eg. Lexer.iter_tokens)
         Output: pt
         """
-        lst = [(True,t) for t in tokens]
-        pt = (False, ([], [lst]))
+        lst = list(tokens)
+        pt = PTNode([], [lst])
         for rule in self.rules:
             # Traverse old pt, generate a new one
             pt = self.parse_apply_rule(rule, pt)
@@ -137,21 +251,66 @@ class Parser():
 
     def print_parse_tree(self, pt, depth=0,step=3):
         """purely for debugging purposes"""
-        isToken, payload = pt
-        if isToken:
-            tk = payload
-            print(" "*depth + f"<{tk.name:10}> {tk.value}")
-        else:
-            tokens,listoflists = payload
-            for t in tokens:
-                print(" "*depth + f"[{t.name:10}] {t.value}")
-            i = 0
-            for l in listoflists:
-                print(" "*depth + f"#{i}")
-                i+=1
-                for el in l:
-                    self.print_parse_tree(el,depth=depth+step)
+        # stack of (pt or line to print, depth), no recursion
+        stack = [(pt, depth)]
+        while len(stack) > 0:
+            pt, depth = stack.pop()
+            if type(pt) is str:
+                print(pt)
+            elif pt.isToken:
+                tk = pt
+                print(" "*depth + f"<{tk.name:10}> {tk.value}")
+            else:
+                tokens,listoflists = pt.tokens,pt.lists
+                for t in tokens:
+                    print(" "*depth + f"[{t.name:10}] {t.value}")
+                items = []
+                i = 0
+                for l in listoflists:
+                    items.append((" "*depth + f"#{i}", depth))
+                    i+=1
+                    for el in l:
+                        items.append((el, depth+step))
+                stack.extend(reversed(items))
+
+
+# list of operators (lowest precedence first):
+BasicParser_list_of_operators = [
+        # assign
+        ["=","+=","-=","/=","*="],
+        # logic
+        ["||"],
+        ["&&"],
+        # bitwise
+        ["|"],
+        ["^"],
+        ["&"],
+        # equal
+        ["==","!="],
+        # cmp
+        ["<", ">", "<=", ">="],
+        # bitwise shift
+        ["<<",">>"],
+        # arith
+        ["+","-"],
+        ["*","/","%"],
+        # unary not
+        ["!","~"],
+        # inc, dec
+        ["++","--"],
+        # pointer
+        ["->","."],
+        ]
 
+# delimiters, in the order of the rules (lowest level first)
+BasicParser_delimiters = ([[("semicolon",";")], [("comma",",")]]
+        + [[("operator",i) for i in l] for l in BasicParser_list_of_operators])
+
+BasicParser_bracket_map = {
+        ")":"(",
+        "]":"[",
+        "}":"{",
+        }
 
 class BasicParser(Parser):
     """
@@ -160,10 +319,21 @@ class BasicParser(Parser):
     - recursive brackets (){}[]
     - comma/semicolon sequences
     - operator separation sequences
+
+    parse does all rules in a single pass, parse_reference applies them
+    one after the other (Parser.parse)
+    fused: parse_reference splits all delimiter levels of a list in one
+        rule (see rule_delimiters_factory), instead of one rule per level
     """
-    def __init__(self):
+    def __init__(self, fused = False):
         super().__init__()
 
+        # (name, value) -> index of the delimiter rule
+        self.delimiter_level = {}
+        for level,l in enumerate(BasicParser_delimiters):
+            for key in l:
+                self.delimiter_level.setdefault(key, level)
+
         ### set up rules
 
         def rule_brackets(nodes):
@@ -171,16 +341,11 @@ class BasicParser(Parser):
             cur_nodes = []
             cur_token = None
             
-            bracket_map = {
-                    ")":"(",
-                    "]":"[",
-                    "}":"{",
-                    }
+            bracket_map = BasicParser_bracket_map
 
             for pt in nodes:
-                isToken,payload = pt
-                if isToken:
-                    tk = payload
+                if pt.isToken:
+                    tk = pt
                     if tk.name == "bracket":
                         if tk.value in bracket_map:
                             # close bracket
@@ -196,7 +361,7 @@ class BasicParser(Parser):
 
                             if cur_token_val == expect:
                                 # create a new bracket pt node:
-                                new_node = (False,([cur_token,tk],[cur_nodes]))
+                                new_node = PTNode([cur_token,tk],[cur_nodes])
                                 # pop from stack
                                 cur_token, cur_nodes = q.pop()
 
@@ -239,9 +404,8 @@ class BasicParser(Parser):
                 # check for occurances:
                 occ = 0
                 for pt in nodes:
-                    isToken,payload = pt
-                    if isToken:
-                        tk = payload
+                    if pt.isToken:
+                        tk = pt
                         key = (tk.name,tk.value)
                         if key in token_dict:
                             occ += 1
@@ -254,12 +418,11 @@ class BasicParser(Parser):
                 listoflists = []
                 cur_nodes = []
                 for pt in nodes:
-                    isToken,payload = pt
-                    if isToken:
-                        tk = payload
+                    if pt.isToken:
+                        tk = pt
                         key = (tk.name,tk.value)
                         if key in token_dict:
-                            tokens.append(payload)
+                            tokens.append(tk)
                             listoflists.append(cur_nodes)
                             cur_nodes = []
                         else:
@@ -269,51 +432,183 @@ class BasicParser(Parser):
                 # append the n+1 st list
                 listoflists.append(cur_nodes)
 
-                new_node = (False,(tokens,listoflists))
+                new_node = PTNode(tokens,listoflists)
                 return [new_node]
 
 
             return rule
 
-        rules = [ 
-            rule_brackets,
-            rule_delimiter_factory([("semicolon",";")]),
-            rule_delimiter_factory([("comma",",")]),
-            ]
-        
-        # list of operators (lowest precedence first):
-        list_of_operators = [
-                # assign
-                ["=","+=","-=","/=","*="],
-                # logic
-                ["||"],
-                ["&&"],
-                # bitwise
-                ["|"],
-                ["^"],
-                ["&"],
-                # equal
-                ["==","!="],
-                # cmp
-                ["<", ">", "<=", ">="],
-                # bitwise shift
-                ["<<",">>"],
-                # arith
-                ["+","-"],
-                ["*","/","%"],
-                # unary not
-                ["!","~"],
-                # inc, dec
-                ["++","--"],
-                # pointer
-                ["->","."],
-                ]
-
-        for l in list_of_operators:
-            rules.append(rule_delimiter_factory([("operator",i) for i in l]))
+        def rule_delimiters_factory(token_levels):
+            """generates a rule that does the rules of rule_delimiter_factory
+            for all levels at once.
+            token_levels = dict (tname,tval) -> level, lowest level first
+            the list is scanned once for the delimiters, then it is split at
+            the lowest level, and only sublists with delimiters are split
+            further.
+            """
+            def split(nodes, lo, hi, delims):
+                """split nodes[lo:hi], delims: its (index, level)"""
+                if len(delims) == 0:
+                    return nodes[lo:hi]
+                level = min(d[1] for d in delims)
+                tokens = []
+                listoflists = []
+                sub = []
+                for d in delims:
+                    i, l = d
+                    if l == level:
+                        tokens.append(nodes[i])
+                        listoflists.append(split(nodes, lo, i, sub))
+                        lo = i+1
+                        sub = []
+                    else:
+                        sub.append(d)
+                listoflists.append(split(nodes, lo, hi, sub))
+                return [PTNode(tokens,listoflists)]
+
+            def rule(nodes):
+                delims = []
+                for i,pt in enumerate(nodes):
+                    if pt.isToken:
+                        level = token_levels.get((pt.name,pt.value))
+                        if level is not None:
+                            delims.append((i,level))
+                if len(delims) == 0:
+                    return nodes
+                return split(nodes, 0, len(nodes), delims)
+
+            return rule
+
+        rules = [rule_brackets]
+        if fused:
+            rules.append(rule_delimiters_factory(self.delimiter_level))
+        else:
+            for l in BasicParser_delimiters:
+                rules.append(rule_delimiter_factory(l))
 
         self.set_rules(rules)
 
+    def parse(self, tokens):
+        """like Parser.parse with the rules, in one pass over the tokens
+
+        Each delimiter rule splits a list at the tokens of its level, and
+        the later rules split the sublists. So in a list, the delimiters of
+        the lowest level are on top, then the next level in the sublists.
+        Per bracket, a stack of frames holds the open delimiter nodes, of
+        increasing level. A delimiter closes the frames above its level,
+        and starts a new sublist in the frame of its level, or opens one.
+        Brackets are checked in token order, like rule_brackets.
+        The tokens and lists of the nodes are tuples, they take less memory.
+        """
+        # the pt has no reference cycles, but its many new nodes and lists
+        # would trigger full collections, that scan all older objects again
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.parse_pass(tokens)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def parse_pass(self, tokens):
+        """the single pass of parse"""
+        semicolons = []
+        statements = []
+        for nodes, tk in self.parse_statements(tokens):
+            statements.append(nodes)
+            if tk is not None:
+                semicolons.append(tk)
+        if len(semicolons) == 0:
+            return PTNode((), (statements[0],))
+        return PTNode((), ((PTNode(tuple(semicolons), tuple(statements)),),))
+
+    def parse_statements(self, tokens):
+        """generator: the pt of the file, one statement at a time
+        yields (nodes, tk) per statement of the top level list, nodes as in
+        the semicolon node of parse, tk: the semicolon after it (None for
+        the last statement). A statement is yielded before the tokens after
+        it are parsed, so bracket errors in them are only found later.
+        """
+        levels = self.delimiter_level
+        # frame: [level, tokens, listoflists, cur_nodes]
+        # the base frame (level -1) holds the list itself
+        frames = [[-1, None, None, []]]
+        brackets = [] # (open bracket token, frames around the bracket)
+
+        def close(frames, level):
+            """close the frames above level, returns the top frame"""
+            top = frames[-1]
+            while top[0] > level:
+                frames.pop()
+                top[2].append(top[3])
+                node = PTNode(tuple(top[1]),tuple(map(tuple,top[2])))
+                top = frames[-1]
+                top[3] = [node]
+            return top
+
+        for tk in tokens:
+            name = tk.name
+            if name == "bracket":
+                value = tk.value
+                if value in BasicParser_bracket_map:
+                    # close bracket
+                    if len(brackets) == 0:
+                        print("ParseError: missing opening bracket.")
+                        tk.mark()
+                        quit()
+                    cur_token, outer = brackets[-1]
+                    if cur_token.value != BasicParser_bracket_map[value]:
+                        print("ParseError: closing bracket did not match with opening bracket.")
+                        cur_token.mark()
+                        tk.mark()
+                        quit()
+                    brackets.pop()
+                    cur_nodes = tuple(close(frames, -1)[3])
+                    frames = outer
+                    frames[-1][3].append(PTNode((cur_token,tk),(cur_nodes,)))
+                else:
+                    # open bracket
+                    brackets.append((tk, frames))
+                    frames = [[-1, None, None, []]]
+                continue
+
+            level = None
+            if name == "operator" or name == "semicolon" or name == "comma":
+                level = levels.get((name, tk.value))
+            if level is None:
+                frames[-1][3].append(tk)
+                continue
+
+            if level == 0 and len(brackets) == 0:
+                # semicolon (level 0) of the top level: the statement is complete
+                top = close(frames, -1)
+                yield tuple(top[3]), tk
+                top[3] = []
+                continue
+
+            top = close(frames, level)
+            if top[0] == level:
+                # next sublist
+                top[1].append(tk)
+                top[2].append(top[3])
+                top[3] = []
+            else:
+                # the nodes since the last delimiter are the first sublist
+                frames.append([level, [tk], [top[3]], []])
+                top[3] = []
+
+        # check if all brackets were matched:
+        if len(brackets) > 0:
+            print("ParseError: opening bracket without closing bracket.")
+            brackets[-1][0].mark()
+            quit()
+
+        yield tuple(close(frames, -1)[3]), None
+
+    def parse_reference(self, tokens):
+        """parse by applying the rules one by one, see Parser.parse"""
+        return super().parse(tokens)
+
 # #######################################
 # ######## PT-Parser section ############
 # #######################################
@@ -321,7 +616,10 @@ class BasicParser(Parser):
 class ASTObject():
     """AST object template, used for PTParse.
     Must implement all member functions below
+    All AST objects have __slots__ (the attributes a class adds),
+    and are recorded by the ASTArena they are made in, if there is one.
     """
+    __slots__ = ()
 
     def __init__(self, pt):
         """
@@ -348,6 +646,77 @@ class ASTObject():
         print(type(self))
         assert(False and "typecheck not implemented")
     
+# innermost ASTArena whose with block runs, see ASTArena.__enter__
+ASTArena_current = None
+
+def ASTArena_objects():
+    """the AST objects that are alive (not the types, they are interned)"""
+    return [obj for obj in gc.get_objects()
+            if isinstance(obj, ASTObject) and not isinstance(obj, ASTObjectType)]
+
+class ASTArena:
+    """helper to clear the AST objects of a compilation together.
+    Not an allocator: the objects are made as usual, the arena only keeps
+    a list of the AST objects made in its with block (that are still alive
+    at its end):
+        arena = ASTArena()
+        with arena:
+            ast = PTParser().parse(pt)
+        ...
+        arena.free()
+    The objects are found with the GC when the block starts and ends,
+    so making AST objects costs nothing extra, with or without an arena.
+    """
+    def __init__(self):
+        self.nodes = []
+        self.outer = None
+        self.before = None # AST objects when the block started
+
+    def __enter__(self):
+        global ASTArena_current
+        self.outer = ASTArena_current
+        ASTArena_current = self
+        # kept alive during the block, so no new object gets their id
+        self.before = ASTArena_objects()
+        return self
+
+    def __exit__(self, *exc):
+        global ASTArena_current
+        before = set(map(id, self.before))
+        self.nodes.extend(obj for obj in ASTArena_objects() if not id(obj) in before)
+        self.before = None
+        if self.outer is not None:
+            # objects of an inner arena are not recorded by the outer one
+            self.outer.before.extend(self.nodes)
+        ASTArena_current = self.outer
+        self.outer = None
+        return False
+
+    def free(self):
+        """clear the slots of all nodes. So they are freed by reference
+        counting, even if some are still referenced (or in cycles)"""
+        slots = {}
+        for node in self.nodes:
+            names = slots.get(type(node))
+            if names is None:
+                names = [n for c in type(node).__mro__ for n in c.__dict__.get("__slots__", ())
+                         if n != "__weakref__"]
+                slots[type(node)] = names
+            for n in names:
+                if hasattr(node, n):
+                    delattr(node, n)
+        self.nodes = []
+
+    def report(self):
+        """list of (class name, number of nodes, bytes per node), most nodes
+        first. bytes: of the node itself, not of the objects it refers to"""
+        counts = {}
+        for node in self.nodes:
+            counts[type(node)] = counts.get(type(node), 0) + 1
+        rows = [(c.__name__, n, sys.getsizeof(object.__new__(c))) for c,n in counts.items()]
+        rows.sort(key=lambda r: -r[1])
+        return rows
+
 class TypeCTX:
     """
     Keeps information about types
@@ -359,26 +728,37 @@ class TypeCTX:
         self.sizeforname = {}
         self.alignmentforname = {}
         self.structmemberoffset = {}
+        # cache of type_size and type_alignment, by type
+        self.sizefortype = {}
+        self.alignmentfortype = {}
 
         # add all number types:
         for name,size in ASTObjectTypeNumber_types.items():
-            ast = ASTObjectTypeNumber(None,name)
+            ast = type_number(name)
             self.typeforname[name] = ast
             self.sizeforname[name] = size
             self.alignmentforname[name] = size
     
     def type_size(self,asttype):
         """byte size of an ast type"""
-        if asttype.isPointer():
-            return 8
-        else:
-            return self.sizeforname[asttype.name]
+        size = self.sizefortype.get(asttype)
+        if size is None:
+            if asttype.isPointer():
+                size = 8
+            else:
+                size = self.sizeforname[asttype.name]
+            self.sizefortype[asttype] = size
+        return size
     def type_alignment(self,asttype):
         """alignment in bytes, of an ast type"""
-        if asttype.isPointer():
-            return 8
-        else:
-            return self.alignmentforname[asttype.name]
+        alignment = self.alignmentfortype.get(asttype)
+        if alignment is None:
+            if asttype.isPointer():
+                alignment = 8
+            else:
+                alignment = self.alignmentforname[asttype.name]
+            self.alignmentfortype[asttype] = alignment
+        return alignment
             
     def check_function_signatures(self,functions):
         """type check dict of functions (their signatures)
@@ -399,8 +779,7 @@ class TypeCTX:
         needed = {}
         needed_cnt = {}
         for name,struct in structs.items():
-            ast = ASTObjectTypeStruct(None,struct.token())
-            self.typeforname[name] = ast
+            self.typeforname[name] = type_struct(name)
             self.structmemberoffset[name] = {}
             needed[name] = {}
             needed_cnt[name] = 0
@@ -413,7 +792,7 @@ class TypeCTX:
                     sname = exp.type.name
                     if sname not in needed:
                         print("TypeError: struct type not found.")
-                        exp.type.token().mark()
+                        exp.type.mark(exp.type_tokens)
                         quit()
                     needed[sname][name] = 1
                     needed_cnt[name] += 1
@@ -435,7 +814,7 @@ class TypeCTX:
             for exp in struct.body:
                 # exp is ASTObjectExpressionDeclaration
                 # check if type is valid
-                exp.type.checkValid(self)
+                exp.type.checkValid(self, exp.type_tokens)
                 if exp.type.isVoid():
                     print("TypeError: struct field cannot have type void.")
                     exp.token().mark()
@@ -461,9 +840,8 @@ class TypeCTX:
         remainder = [name for name,cnt in needed_cnt.items() if cnt!=0]
         if len(remainder)>0:
             name = remainder[0]
-            ast = self.typeforname[name]
             print("TypeError: type has cyclic dependencies.")
-            ast.token().mark()
+            structs[name].token().mark()
             quit()
 
 class CodeCTXFunction:
@@ -863,26 +1241,23 @@ class CodeCTX:
 
 def ptparse_strip(pt):
     """strip shell if meaningless:
-    (False,([],[[pt]])) -> pt
+    PTNode([],[[pt]]) -> pt
     """
-    isToken,payload = pt
-    if not isToken:
-        tokens,listoflists = payload
-        if len(tokens)==0 and len(listoflists)==1 and len(listoflists[0])==1:
-            return listoflists[0][0]
+    if not pt.isToken:
+        if pt.kind == PTNode_list and len(pt.lists)==1 and len(pt.lists[0])==1:
+            return pt.lists[0][0]
     return pt
 
 def ptparse_unpack_brackets(pt,bracket):
     """unpack a layer of brackets
-    expect: (False, ([bracket,bracket],[[lst]]))
-    if match: return (False,([],[[lst]]))
+    expect: PTNode([bracket,bracket],[[lst]])
+    if match: return PTNode([],[[lst]])
     else None
     """
-    isToken,payload = pt
-    if isToken:
+    if pt.isToken:
         return None
     
-    tokens,listoflists = payload
+    tokens,listoflists = pt.tokens,pt.lists
     if len(tokens) !=2 or len(listoflists)!=1:
         return None
     
@@ -890,7 +1265,7 @@ def ptparse_unpack_brackets(pt,bracket):
         return None
 
     # success
-    return (False, ([], listoflists))
+    return PTNode([], listoflists)
 
 def ptparse_delimiter_list(pt,delimiters):
     """check if is a delimiter list
@@ -903,11 +1278,10 @@ def ptparse_delimiter_list(pt,delimiters):
     """
     ddict = {d:1 for d in delimiters}
     
-    isToken,payload = pt
-    if isToken:
+    if pt.isToken:
         return ([],[[pt]])
     else:
-        tokens,listoflists = payload
+        tokens,listoflists = pt.tokens,pt.lists
         if len(tokens) == 0:
             if len(listoflists)==1:
                 return ([],listoflists)
@@ -931,11 +1305,10 @@ def ptparse_isdelimiterlist(pt,delimiters):
     """
     ddict = {d:1 for d in delimiters}
     
-    isToken,payload = pt
-    if isToken:
+    if pt.isToken:
         return False
     else:
-        tokens,listoflists = payload
+        tokens,listoflists = pt.tokens,pt.lists
         if len(tokens) == 0:
             return False
         else:
@@ -948,11 +1321,10 @@ def ptparse_isdelimiterlist(pt,delimiters):
 
 
 def ptparse_isNothing(pt):
-    """Check if pt is (False, ([],[[]]))"""
-    isToken,payload = pt
-    if isToken:
+    """Check if pt is PTNode([],[[]])"""
+    if pt.isToken:
         return False
-    tokens,listoflists = payload
+    tokens,listoflists = pt.tokens,pt.lists
     if len(tokens) != 0 or len(listoflists) != 1 or len(listoflists[0])!=0:
         return False
     return True
@@ -962,14 +1334,13 @@ def ptparse_isToken(pt, token_list=None):
     if token_list is not None: also check if matches
     a (name, val) pair. If val is None -> match
     """
-    isToken,payload = pt
-    if not isToken:
+    if not pt.isToken:
         return False
     else:
         if token_list is None:
             return True
         tdict = {d:1 for d in token_list}
-        tk = payload
+        tk = pt
         if (tk.name,tk.value) in tdict or (tk.name,None) in tdict:
             return True
         else:
@@ -998,12 +1369,16 @@ def ptparse_tokenmax(t1,t2):
         return t2
 
 def ptparse_getfirsttoken(pt,cmpf = ptparse_tokenmin):
-    """given pt, extract first token (recursively)"""
-    isToken,payload = pt
-    if isToken:
-        return payload
+    """given pt, extract first token
+    (last token for ptparse_tokenmax, both stored on the PTNode)"""
+    if pt.isToken:
+        return pt
+    elif cmpf is ptparse_tokenmin:
+        return pt.first
+    elif cmpf is ptparse_tokenmax:
+        return pt.last
     else:
-        tokens,listoflists = payload
+        tokens,listoflists = pt.tokens,pt.lists
         cur = None
         for t in tokens:
             cur = cmpf(cur,t)
@@ -1013,7 +1388,7 @@ def ptparse_getfirsttoken(pt,cmpf = ptparse_tokenmin):
         return cur
 
 def ptparse_markfirsttokeninlist(l,cmpf = ptparse_tokenmin):
-    """takes list of pt's, search recursively for first token"""
+    """takes list of pt's, mark their first token"""
     cur = None
     for pt in l:
         cur = cmpf(cur, ptparse_getfirsttoken(pt,cmpf))
@@ -1021,15 +1396,14 @@ def ptparse_markfirsttokeninlist(l,cmpf = ptparse_tokenmin):
 
 
 def ptparse_getlist(pt,k):
-    """if pt = (False,[],[[k-elements]])
+    """if pt = PTNode([],[[k-elements]])
     return list of k-elements
     else: return None
     """
-    isToken,payload = pt
-    if isToken:
+    if pt.isToken:
         return None
     else:
-        tokens,listoflists = payload
+        tokens,listoflists = pt.tokens,pt.lists
         if len(tokens)==0 and len(listoflists)==1 and len(listoflists[0])==k:
             return listoflists[0]
         else:
@@ -1045,11 +1419,29 @@ def ptparse_expression(pt):
     # - operators
     # - funcptr (args): function call (take first, apply rest)
     # - cast (type,expr): fake function
-    
-    isToken,payload = pt
 
-    if isToken:
-        tk = payload
+    # unpack brackets and shells in a loop, not by recursion:
+    # ((((x)))) can be nested deeper than the recursion limit
+    while not pt.isToken:
+        tokens, listoflists = pt.tokens, pt.lists
+        if len(tokens) == 0:
+            assert(len(listoflists)==1)
+            if len(listoflists[0]) != 1:
+                break
+            pt = listoflists[0][0]
+        elif tokens[0].name == "bracket" and tokens[0].value == "(":
+            unpack = ptparse_unpack_brackets(pt,"(")
+            strip = ptparse_strip(unpack)
+            if ptparse_isNothing(strip):
+                print("PTParseError: expected expression inside brackets.")
+                tokens[0].mark()
+                quit()
+            pt = strip
+        else:
+            break
+
+    if pt.isToken:
+        tk = pt
         if tk.name == "name":
             return ASTObjectExpressionName(pt)
         elif tk.name == "str":
@@ -1062,17 +1454,13 @@ def ptparse_expression(pt):
             quit()
             
     else:
-        tokens, listoflists = payload
+        tokens, listoflists = pt.tokens, pt.lists
         if len(tokens) == 0:
             assert(len(listoflists)==1)
             ll = listoflists[0]
             if len(ll) == 0:
                 # TODO: some sort of panick mode?
                 assert(False and "nothing")
-            elif len(ll) == 1:
-                # must unpack
-                ptsub = ll[0]
-                return ptparse_expression(ptsub)
             elif ptparse_isToken(ll[0], [("keyword","var"),("keyword","const")]):
                 # var/const definition
                 return ASTObjectExpressionDeclaration(pt)
@@ -1103,30 +1491,27 @@ def ptparse_expression(pt):
             if tk.name == "operator":
                 return ptparse_expression_operator(pt)
             elif tk.name == "bracket":
-                if tk.value == "(":
-                    # unpack brackets
-                    unpack = ptparse_unpack_brackets(pt,"(")
-                    strip = ptparse_strip(unpack)
-                    if ptparse_isNothing(strip):
-                        print("PTParseError: expected expression inside brackets.")
-                        tokens[0].mark()
-                        quit()
-                    return ptparse_expression(strip)
-                elif tk.value == "{":
+                # "(": unpacked above
+                if tk.value == "{":
                     return ASTObjectExpressionScope(pt)
                 else:
                     print("PTParseError: unexpected bracket in expression.")
                     tokens[0].mark()
                     quit()
             else:
-                print(tokens)
+                print(list(tokens))
                 assert(False and "unhandled token")
 
+def ptparse_expression_list(l):
+    """ptparse_expression of PTNode([],[l]), without the node if l has one element"""
+    if len(l) == 1:
+        return ptparse_expression(l[0])
+    return ptparse_expression(PTNode([],[l]))
+
 def ptparse_expression_operator(pt):
     """Parse operator expression."""
-    isToken, payload = pt
-    assert(not isToken)
-    tokens,listoflists = payload
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
     assert(len(tokens)>0)
     assert(tokens[0].name == "operator")
 
@@ -1171,7 +1556,7 @@ def ptparse_expression_operator(pt):
                 return ASTObjectExpressionRef(pt)
             return ASTObjectExpressionBinOp(pt)
     else:
-        print(tokens)
+        print(list(tokens))
         assert(False and "token not handled")
 
 def ptparse_delimiterlist_ltr(pt):
@@ -1179,18 +1564,17 @@ def ptparse_delimiterlist_ltr(pt):
     x + v
       x + v
         x + ..."""
-    isToken, payload = pt
-    assert(not isToken)
-    tokens,listoflists = payload
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
     assert(len(tokens) + 1 == len(listoflists))
 
     # extract rightmost elements
-    rhs = (False,([tokens[-1]], listoflists[-2:]))
+    rhs = PTNode([tokens[-1]], listoflists[-2:])
     
     # reduce over rest of elements
     i = len(tokens)-2
     while i>=0:
-        rhs = (False, ([tokens[i]], [listoflists[i], [rhs]]))
+        rhs = PTNode([tokens[i]], [listoflists[i], [rhs]])
         i-=1
 
     return rhs
@@ -1200,83 +1584,113 @@ def ptparse_delimiterlist_rtl(pt):
           v + x
         v + x
     ... + x"""
-    isToken, payload = pt
-    assert(not isToken)
-    tokens,listoflists = payload
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
     assert(len(tokens) + 1 == len(listoflists))
 
     # extract leftmostmost elements
-    lhs = (False,([tokens[0]], listoflists[0:2]))
+    lhs = PTNode([tokens[0]], listoflists[0:2])
     
     # reduce over rest of elements
     i = 1
     while i<len(tokens):
-        lhs = (False, ([tokens[i]], [[lhs],listoflists[i+1]]))
+        lhs = PTNode([tokens[i]], [[lhs],listoflists[i+1]])
         i+=1
     return lhs
 
+def ptparse_binop_lhs(pt):
+    """pt: binary operator (one token, two lists).
+    if ptparse_expression parses its lhs into a binary operator too:
+    return the pt of that operator, else None
+    """
+    lhs = pt.lists[0]
+    if len(lhs) != 1 or lhs[0].isToken:
+        return None
+    op = lhs[0]
+    if len(op.tokens) == 0 or op.tokens[0].name != "operator":
+        return None
+    if not op.tokens[0].value in ASTObjectExpressionBinOp_rtl_operators:
+        return None
+    if len(op.tokens) > 1:
+        op = ptparse_delimiterlist_rtl(op)
+    if op.tokens[0].value in ["->","."] or len(op.lists) != 2:
+        return None
+    if len(op.lists[0]) == 0 or len(op.lists[1]) == 0:
+        return None # unary or error
+    return op
+
+def ptparse_scope_statement(ll):
+    """if list ll is a scope {...}, return its pt, else None"""
+    if len(ll) != 1 or ll[0].isToken:
+        return None
+    tokens = ll[0].tokens
+    if len(tokens) == 0 or tokens[0].name != "bracket" or tokens[0].value != "{":
+        return None
+    return ll[0]
+
 def ptparse_list_rtl(pt):
     """Take any list, right to left
         v x
        v x
     ... x"""
-    isToken, payload = pt
-    assert(not isToken)
-    tokens,listoflists = payload
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
     assert(len(tokens) ==0)
     assert(len(listoflists)==1)
     ll = listoflists[0]
 
     # extract leftmostmost elements
-    lhs = (False,([], [[ll[0], ll[1]]]))
+    lhs = PTNode([], [[ll[0], ll[1]]])
     
     # reduce over rest of elements
     i = 2
     while i<len(ll):
-        lhs = (False, ([], [[lhs,ll[i]]]))
+        lhs = PTNode([], [[lhs,ll[i]]])
         i+=1
 
     return lhs
 
-def ptparse_type(pt):
+def ptparse_type(pt, type_tokens):
     """
     forms:
     - name: value type
     - *name: pointer type
     - out_t(in_t,in_t): function type
 
+    the types are interned, the tokens of struct names in the type are
+    appended to the list type_tokens (for error messages, see checkValid)
+
     need to check things like:
     - assignment
     - casting
     - operators
     """
     
-    isToken,payload = pt
-
-    if isToken:
-        tk = payload
+    if pt.isToken:
+        tk = pt
         if tk.name == "name" or tk.name == "type":
             if tk.value in ASTObjectTypeNumber_types:
-                return ASTObjectTypeNumber(pt)
+                return type_number(tk.value)
             elif tk.name == "type" and tk.value == "void":
-                return ASTObjectTypeVoid(pt)
+                return type_void()
             else:
-                return ASTObjectTypeStruct(pt)
+                type_tokens.append(tk)
+                return type_struct(tk.value)
         else:
             print("PTParseError: syntax error: expected type name.")
             tk.mark()
             quit()
     else:
-        tokens,listoflists = payload
+        tokens,listoflists = pt.tokens,pt.lists
         if len(tokens) == 0:
             assert(len(listoflists)==1)
             ll = listoflists[0]
             if len(ll) == 1:
                 strip = ll[0]
-                return ptparse_type(strip)
+                return ptparse_type(strip, type_tokens)
             elif len(ll)==2:
                 # function type
-                return ASTObjectTypeFunction(pt) 
+                return type_function(*ptparse_function_type(pt, type_tokens))
             else:
                 print("PTParseError: syntax error: around type description.")
                 ptparse_markfirsttokeninlist(ll)
@@ -1289,13 +1703,13 @@ def ptparse_type(pt):
                 # unpack bracket and strip
                 unpack = ptparse_unpack_brackets(pt,"(")
                 strip = ptparse_strip(unpack)
-                return ptparse_type(strip)
+                return ptparse_type(strip, type_tokens)
             elif tk.name == "operator":
                 if tk.value == "*":
                     if len(tokens) > 1:
                         pt_ltr = ptparse_delimiterlist_ltr(pt)
-                        return ptparse_type(pt_ltr)
-                    return ASTObjectTypePointer(pt)
+                        return ptparse_type(pt_ltr, type_tokens)
+                    return type_pointer(ptparse_type(ptparse_pointer_type(pt), type_tokens))
                 else:
                     print("PTParseError: unexpected operator token in type.")
                     tk.mark()
@@ -1308,6 +1722,122 @@ def ptparse_type(pt):
 
     assert(False and "panick")
 
+def ptparse_function_type(pt, type_tokens):
+    """return type and list of argument types of a function type
+    out_t(in_t,in_t), see ptparse_type for type_tokens"""
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
+    assert(len(tokens)==0)
+    assert(len(listoflists)==1)
+    ll = listoflists[0]
+    assert(len(ll)==2)
+
+    # return type:
+    return_type = ptparse_type(ll[0], type_tokens)
+
+    # argument types:
+    unpack = ptparse_unpack_brackets(ll[1],"(")
+    if unpack is None:
+        print("PTParseError: syntax error: expected brackets for arguments of function type.")
+        ptparse_markfirsttokeninlist([ll[1]])
+        quit()
+    
+    unpack = ptparse_strip(unpack)
+    tokens,listoflists = ptparse_delimiter_list(unpack,[("comma",",")])
+    argument_types = []
+
+    # check that none of the lists is empty
+    if len(tokens)>0:
+        for i,ll in enumerate(listoflists):
+            if len(ll)==0:
+                if i == 0:
+                    print("PTParseError: syntax error: expected function argument type before this comma.")
+                    tokens[0].makr()
+                    quit()
+                else:
+                    print("PTParseError: syntax error: expected function argument type after this comma.")
+                    tokens[i-1].mark()
+                    quit()
+
+    # parse the argument types
+    for ll in listoflists:
+        if len(ll)>0:
+            arg = ptparse_type(PTNode([],[ll]), type_tokens)
+            argument_types.append(arg)
+    return return_type, argument_types
+
+def ptparse_pointer_type(pt):
+    """pt of the type a pointer type (* sth) points to"""
+    assert(not pt.isToken)
+    tokens,listoflists = pt.tokens,pt.lists
+    assert(len(tokens)==1)
+    # expect pointer type:
+    # * sth
+    if len(tokens)>1:
+        print("PTParseError: too many operator tokens for pointer type.")
+        tokens[0].mark()
+        quit()
+    assert(len(listoflists)==2)
+    lhs = listoflists[0]
+    rhs = listoflists[1]
+    if len(lhs)>0:
+        print("PTParseError: syntax error: nothing allowed left of pointer type '*'.")
+        tokens[0].mark()
+        quit()
+    return PTNode([],[rhs])
+
+# type objects, by key (see ASTObjectType.intern_key). All type objects
+# are made here, outside of any ASTArena: types with the same key are the
+# same object, so equals is identity. Struct types are interned by name,
+# the tokens of a use of a type are kept by the ast that uses it
+# (type_tokens, see ptparse_type).
+# The table holds them weakly: a type lives as long as an ast (or TypeCTX)
+# refers to it, so compilations that are alive at the same time share it,
+# and it is dropped with the last of them (a type only refers to the types
+# it is made of, so this needs no cyclic GC).
+ASTObjectType_interned = weakref.WeakValueDictionary()
+
+def type_interned(key):
+    """type object for a key (see ASTObjectType.intern_key)"""
+    t = ASTObjectType_interned.get(key)
+    if t is None:
+        kind = key[0]
+        if kind == "void":
+            t = object.__new__(ASTObjectTypeVoid)
+        elif kind == "number":
+            t = object.__new__(ASTObjectTypeNumber)
+            t.name = key[1]
+        elif kind == "struct":
+            t = object.__new__(ASTObjectTypeStruct)
+            t.name = key[1]
+        elif kind == "pointer":
+            t = object.__new__(ASTObjectTypePointer)
+            t.type = key[1]
+        else:
+            assert(kind == "function")
+            t = object.__new__(ASTObjectTypeFunction)
+            t.return_type = key[1]
+            t.argument_types = list(key[2:])
+        ASTObjectType_interned[key] = t
+    return t
+
+def type_number(name):
+    return type_interned(("number", name))
+
+def type_void():
+    return type_interned(("void",))
+
+def type_struct(name):
+    return type_interned(("struct", name))
+
+def type_pointer(t):
+    """pointer type to t"""
+    return type_interned(("pointer", t))
+
+def type_function(return_type, argument_types):
+    """function type"""
+    return type_interned(("function", return_type) + tuple(argument_types))
+
 # ##########################
 # # ASTObjects for parsing #
 # ##########################
@@ -1315,10 +1845,18 @@ def ptparse_type(pt):
 class ASTObjectType(ASTObject):
     """
     generic Type ast object
+    types are interned, they are only made by type_interned
+    (see ptparse_type, type_number, type_pointer...)
     """
+    __slots__ = ("__weakref__",)
     def __init__(self,pt):
         assert(False)
 
+    @property
+    def canonical(self):
+        """the interned object of this type: the type itself"""
+        return self
+
     # attributes to be defined by all:
     def isPointer(self):
         return False
@@ -1333,15 +1871,20 @@ class ASTObjectType(ASTObject):
     def isNull(self):
         return False
 
-    def checkValid(self, typectx):
-        """Check if a type is valid"""
+    def checkValid(self, typectx, tokens):
+        """Check if a type is valid
+        tokens: the struct name tokens of the use of the type (type_tokens),
+        for the error messages
+        """
         assert(False and "not implemented")
-    
-    def equals(self,other):
-        print(self)
-        print(other)
+
+    def intern_key(self):
+        """key of the type in ASTObjectType_interned"""
         assert(False and "not implemented")
 
+    def equals(self,other):
+        return self is other
+
     def toStr(self):
         print(self)
         assert(False and "not implemented")
@@ -1366,24 +1909,19 @@ class ASTObjectTypeVoid(ASTObjectType):
     """
     void type ast object
     """
-    def __init__(self,pt,token=None):
-        if pt is None:
-            # if pt is None, token cannot be None
-            assert(not token is None)
-        else:
-            assert(ptparse_isToken(pt,[("type","void")]))
-    
+    __slots__ = ()
+
     def isVoid(self):
         return True
 
     def print_ast(self,depth=0,step=3):
         print(" "*depth + f"[void-type]")
      
-    def checkValid(self, typectx):
+    def checkValid(self, typectx, tokens):
         pass
 
-    def equals(self,other):
-        return type(self)==type(other)
+    def intern_key(self):
+        return ("void",)
     def toStr(self):
         return "void"
     def sizeof(self,codectx):
@@ -1393,28 +1931,8 @@ class ASTObjectTypePointer(ASTObjectType):
     """
     pointer type ast object
     """
-    def __init__(self,pt):
-        isToken,payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
-        assert(len(tokens)==1)
-        # expect pointer type:
-        # * sth
-        if len(tokens)>1:
-            print("PTParseError: too many operator tokens for pointer type.")
-            tokens[0].mark()
-            quit()
-        assert(len(listoflists)==2)
-        lhs = listoflists[0]
-        rhs = listoflists[1]
-        if len(lhs)>0:
-            print("PTParseError: syntax error: nothing allowed left of pointer type '*'.")
-            tokens[0].mark()
-            quit()
+    __slots__ = ("type",)
 
-        # now go recursive
-        self.type = ptparse_type((False, ([],[rhs])))
-    
     def isPointer(self):
         return True
     def canDeref(self):
@@ -1427,13 +1945,11 @@ class ASTObjectTypePointer(ASTObjectType):
         print(" "*depth + f"[pointer-type]")
         self.type.print_ast(depth = depth+step)
      
-    def checkValid(self, typectx):
-        self.type.checkValid(typectx)
+    def checkValid(self, typectx, tokens):
+        self.type.checkValid(typectx, tokens)
 
-    def equals(self,other):
-        if not type(self)==type(other):
-            return False
-        return self.type.equals(other.type)
+    def intern_key(self):
+        return ("pointer", self.type)
 
     def toStr(self):
         return f"*{self.type.toStr()}"
@@ -1519,17 +2035,7 @@ class ASTObjectTypeNumber(ASTObjectType):
     """
     number type ast object, see list in dictionary above:
     """
-    def __init__(self,pt, name=None):
-        """use name if want to generate from name"""
-        if name is None:
-            isToken,payload = pt
-            assert(isToken)
-            tk = payload
-            assert(tk.name == "name" or tk.name == "type")
-            assert(tk.value in ASTObjectTypeNumber_types)
-            self.name = tk.value
-        else:
-            self.name = name
+    __slots__ = ("name",)
 
     def isNumber(self):
         return True
@@ -1540,14 +2046,12 @@ class ASTObjectTypeNumber(ASTObjectType):
     def print_ast(self,depth=0,step=3):
         print(" "*depth + f"[number-type] {self.name}")
     
-    def checkValid(self, typectx):
+    def checkValid(self, typectx, tokens):
         assert(self.name in typectx.typeforname)
         assert(typectx.typeforname[self.name].isNumber())
     
-    def equals(self,other):
-        if not type(self)==type(other):
-            return False
-        return self.name == other.name
+    def intern_key(self):
+        return ("number", self.name)
  
     def toStr(self):
         return self.name
@@ -1596,7 +2100,7 @@ class ASTObjectTypeNumber(ASTObjectType):
         return ctype,cval
         """
         ctype = ASTObjectTypeNumber_types_to_signed[self.name]
-        ctype = ASTObjectTypeNumber(None,ctype)
+        ctype = type_number(ctype)
         cval = self.softCastImmediate(ctype, oval)
         if ctype is None:
             print(f"Warning: cannot signedCastImmediate {self.toStr()}")
@@ -1716,21 +2220,14 @@ class ASTObjectTypeStruct(ASTObjectType):
     """
     struct type ast object
     """
-    def __init__(self,pt,token = None):
-        """if from pt: only give pt, if from token set pt=None"""
-        if token is None:
-            isToken,payload = pt
-            assert(isToken)
-            tk = payload
-            assert(tk.name == "name")
-            self.name = tk.value
-            self.token_ = tk
-        else:
-            self.token_ = token
-            self.name = token.value
-    
-    def token(self):
-        return self.token_
+    __slots__ = ("name",)
+
+    def mark(self, tokens):
+        """mark the name of the struct in the tokens of a use (type_tokens)"""
+        for tk in tokens:
+            if tk.value == self.name:
+                tk.mark()
+                return
 
     def isStruct(self):
         return True
@@ -1738,77 +2235,28 @@ class ASTObjectTypeStruct(ASTObjectType):
     def print_ast(self,depth=0,step=3):
         print(" "*depth + f"[struct-type] {self.name}")
     
-    def checkValid(self, typectx):
+    def checkValid(self, typectx, tokens):
         if not self.name in typectx.typeforname:
             print("TypeError: struct not declared.")
-            self.token().mark()
+            self.mark(tokens)
             quit()
         assert(typectx.typeforname[self.name].isStruct())
  
-    def equals(self,other):
-        if not type(self)==type(other):
-            return False
-        return self.name == other.name
+    def intern_key(self):
+        return ("struct", self.name)
     
     def toStr(self):
         return self.name
     
     def sizeof(self,codectx):
-        return codectx.typectx.sizeforname[self.name]
+        return codectx.typectx.type_size(self)
 
 
 class ASTObjectTypeFunction(ASTObjectType):
     """
     function type ast object
     """
-    def __init__(self,pt,_return_type=None,_arg_types=None):
-        """If want to set from types, then can"""
-        if _return_type is not None:
-            assert(_arg_types is not None)
-            self.return_type = _return_type
-            self.argument_types = _arg_types
-        else:
-            isToken,payload = pt
-            assert(not isToken)
-            tokens,listoflists = payload
-            assert(len(tokens)==0)
-            assert(len(listoflists)==1)
-            ll = listoflists[0]
-            assert(len(ll)==2)
-
-            # return type:
-            self.return_type = ptparse_type(ll[0])
-
-            # argument types:
-            unpack = ptparse_unpack_brackets(ll[1],"(")
-            if unpack is None:
-                print("PTParseError: syntax error: expected brackets for arguments of function type.")
-                ptparse_markfirsttokeninlist([ll[1]])
-                quit()
-            
-            unpack = ptparse_strip(unpack)
-            tokens,listoflists = ptparse_delimiter_list(unpack,[("comma",",")])
-            self.argument_types = []
-
-            # check that none of the lists is empty
-            if len(tokens)>0:
-                for i,ll in enumerate(listoflists):
-                    if len(ll)==0:
-                        if i == 0:
-                            print("PTParseError: syntax error: expected function argument type before this comma.")
-                            tokens[0].makr()
-                            quit()
-                        else:
-                            print("PTParseError: syntax error: expected function argument type after this comma.")
-                            tokens[i-1].mark()
-                            quit()
-
-            # parse the argument types
-            for ll in listoflists:
-                if len(ll)>0:
-                    arg = ptparse_type((False,([],[ll])))
-                    self.argument_types.append(arg)
- 
+    __slots__ = ("return_type", "argument_types")
 
     def isFunction(self):
         return True
@@ -1821,24 +2269,13 @@ class ASTObjectTypeFunction(ASTObjectType):
         for arg in self.argument_types:
             arg.print_ast(depth = depth+step)
     
-    def checkValid(self, typectx):
-        self.return_type.checkValid(typectx)
+    def checkValid(self, typectx, tokens):
+        self.return_type.checkValid(typectx, tokens)
         for arg in self.argument_types:
-            arg.checkValid(typectx)
+            arg.checkValid(typectx, tokens)
 
-    def equals(self,other):
-        if not type(self)==type(other):
-            return False
-        if not self.return_type.equals(other.return_type):
-            return False
-        if len(self.argument_types) != len(other.argument_types):
-            return False
-        for i in range(len(self.argument_types)):
-            a1 = self.argument_types[i]
-            a2 = other.argument_types[i]
-            if not a1.equals(a2):
-                return False
-        return True
+    def intern_key(self):
+        return ("function", self.return_type) + tuple(self.argument_types)
 
     def toStr(self):
         args = ",".join([a.toStr() for a in self.argument_types])
@@ -1879,9 +2316,12 @@ class ASTObjectTypeFunction(ASTObjectType):
 class ASTObjectFunction(ASTObject):
     """
     Function ast object
+    lazy: the body is only parsed on first use (see body), so syntax
+    errors in it are reported then. The signature is parsed up front.
     """
+    __slots__ = ("return_type", "return_type_tokens", "name", "name_token", "varconst", "arguments", "hasBody", "body_pt", "body_")
 
-    def __init__(self,pt):
+    def __init__(self,pt,lazy = False):
         # function type name (bracket-body) {bracket-body}
         l = ptparse_getlist(pt, 5) # get the 5 elements def
         if l is None:
@@ -1900,12 +2340,14 @@ class ASTObjectFunction(ASTObject):
             quit()
 
         # check return type:
-        self.return_type = ptparse_type(l[1])
+        tokens = []
+        self.return_type = ptparse_type(l[1], tokens)
+        self.return_type_tokens = tuple(tokens)
 
         # check name:
         if ptparse_isToken(l[2],[("name",None)]):
-            self.name_token = l[2][1]
-            self.name = l[2][1].value
+            self.name_token = l[2]
+            self.name = l[2].value
         
         # check args:
         # l[3]
@@ -1937,20 +2379,45 @@ class ASTObjectFunction(ASTObject):
         # parse the arguments
         for ll in listoflists:
             if len(ll)>0:
-                arg = ASTObjectVarConst((False,([],[ll])))
+                arg = ASTObjectVarConst(PTNode([],[ll]))
                 if not arg.isMutable:
                     print("PTParseError: function arguments must be var, not const.")
                     arg.token().mark()
                     quit()
                 self.add_argument(arg)
         
+        self.body_ = None
+        self.body_pt = None
         if len(l) == 5: # function definition
             # check body:
             # l[4]
-            # expect (comma list):
-            self.body = ASTObjectExpressionScope(l[4])
+            self.hasBody = True
+            if lazy:
+                # expect {scope}, parsed on first use
+                if ptparse_unpack_brackets(l[4],"{") is None:
+                    print("PTParseError: syntax error: expected scope brackets.")
+                    ptparse_markfirsttokeninlist([l[4]])
+                    quit()
+                self.body_pt = l[4]
+            else:
+                # expect (comma list):
+                self.body_ = ASTObjectExpressionScope(l[4])
         else: # function declaration
-            self.body = None
+            self.hasBody = False
+
+    @property
+    def body(self):
+        """ASTObjectExpressionScope of the body, or None for a declaration"""
+        if self.body_pt is not None:
+            self.parse_body()
+        return self.body_
+
+    def parse_body(self):
+        """parse the body, if not done yet. Returns it (None if declaration)"""
+        if self.body_pt is not None:
+            self.body_ = ASTObjectExpressionScope(self.body_pt)
+            self.body_pt = None
+        return self.body_
     
     def add_argument(self,arg):
         """arg: ASTObjectVarConst
@@ -1976,15 +2443,13 @@ class ASTObjectFunction(ASTObject):
  
     def checkSignature(self, typectx):
         """Check type validity of signature"""
-        self.return_type.checkValid(typectx)
+        self.return_type.checkValid(typectx, self.return_type_tokens)
         for arg in self.arguments:
-            arg.type.checkValid(typectx)
+            arg.type.checkValid(typectx, arg.type_tokens)
 
     def signature(self):
         """return type of function"""
-        return ASTObjectTypeFunction(None,
-                self.return_type,
-                [a.type for a in self.arguments])
+        return type_function(self.return_type, [a.type for a in self.arguments])
     
     def checkCompatible(self,other):
         """checks if two Function objects are compatible.
@@ -1992,7 +2457,7 @@ class ASTObjectFunction(ASTObject):
         or the definition if one exists
         or else self 
         """
-        if (not self.body is None) and (not other.body is None):
+        if self.hasBody and other.hasBody:
             print("PTParseError: duplicate definition.")
             self.token().mark()
             other.token().mark()
@@ -2004,7 +2469,7 @@ class ASTObjectFunction(ASTObject):
             other.token().mark()
             quit()
 
-        if other.body:
+        if other.hasBody:
             return other
         return self
 
@@ -2026,6 +2491,7 @@ class ASTObjectStruct(ASTObject):
     """
     Struct ast object
     """
+    __slots__ = ("name", "name_token", "body")
 
     def __init__(self,pt):
         # struct name {bracket-body}
@@ -2045,8 +2511,8 @@ class ASTObjectStruct(ASTObject):
 
         # check name:
         if ptparse_isToken(l[1],[("name",None)]):
-            self.name_token = l[1][1]
-            self.name = l[1][1].value
+            self.name_token = l[1]
+            self.name = l[1].value
         
         # check body:
         unpack = ptparse_unpack_brackets(l[2],"{")
@@ -2063,7 +2529,7 @@ class ASTObjectStruct(ASTObject):
         self.body = []
         for ll in listoflists:
             if len(ll) > 0:
-                exp = ASTObjectExpressionDeclaration((False,([],[ll])))
+                exp = ASTObjectExpressionDeclaration(PTNode([],[ll]))
                 self.body.append(exp)
 
     def token(self):
@@ -2081,6 +2547,7 @@ class ASTObjectExpression(ASTObject):
     Expression ast object
     this is the 
     """
+    __slots__ = ()
 
     def __init__(self,pt):
         assert(False)
@@ -2115,27 +2582,44 @@ class ASTObjectExpression(ASTObject):
         assert(False and "not implemented")
 
 class ASTObjectExpressionScope(ASTObjectExpression):
-    """Code scope {block}"""
+    """Code scope {block}
+    Nested scopes {{...}} are handled with a stack of the open scopes,
+    not with recursion, they can be deep.
+    """
+    __slots__ = ("token_", "body")
 
     def __init__(self,pt):
+        # parse list of body instructions.
+        # They are a sequence of expressions.
+        # For this we apply a general expression detector.
+        stack = [(self, iter(self.init_parse(pt)))]
+        while len(stack) > 0:
+            scope, statements = stack[-1]
+            for ll in statements:
+                nested = ptparse_scope_statement(ll)
+                if nested is not None:
+                    exp = ASTObjectExpressionScope.__new__(ASTObjectExpressionScope)
+                    scope.body.append(exp)
+                    stack.append((exp, iter(exp.init_parse(nested))))
+                    break
+                exp = ptparse_expression_list(ll)
+                scope.body.append(exp)
+            else:
+                stack.pop()
+
+    def init_parse(self,pt):
+        """check brackets, returns the lists of the body instructions"""
         unpack = ptparse_unpack_brackets(pt,"{")
         if unpack is None:
             print("PTParseError: syntax error: expected scope brackets.")
             ptparse_markfirsttokeninlist([pt])
             quit()
-        self.token_ = pt[1][0][0]
+        self.token_ = pt.tokens[0]
         
         unpack = ptparse_strip(unpack)
         tokens,listoflists = ptparse_delimiter_list(unpack,[("semicolon",";")])
-
-        # parse list of body instructions.
-        # They are a sequence of expressions.
-        # For this we apply a general expression detector.
         self.body = []
-        for ll in listoflists:
-            if len(ll) > 0:
-                exp = ptparse_expression((False,([],[ll])))
-                self.body.append(exp)
+        return [ll for ll in listoflists if len(ll) > 0]
 
     def isReadable(self):
         return True
@@ -2147,30 +2631,51 @@ class ASTObjectExpressionScope(ASTObjectExpression):
 
     def print_ast(self,depth=0,step=3):
         print(" "*depth + f"[Scope]")
-        for exp in self.body:
-            exp.print_ast(depth = depth+step)
+        stack = [(iter(self.body), depth)]
+        while len(stack) > 0:
+            body, depth = stack[-1]
+            for exp in body:
+                if type(exp) is ASTObjectExpressionScope:
+                    print(" "*(depth+step) + f"[Scope]")
+                    stack.append((iter(exp.body), depth+step))
+                    break
+                exp.print_ast(depth = depth+step)
+            else:
+                stack.pop()
 
     def codegen_expression(self,codectx,needImmediate):
         """See super for desc"""
         
+        stack = [iter(self.codegen_open(codectx))]
+        while len(stack) > 0:
+            for exp in stack[-1]:
+                if type(exp) is ASTObjectExpressionScope:
+                    stack.append(iter(exp.codegen_open(codectx)))
+                    break
+                eType,eReg,eVal = exp.codegen_expression(codectx,needImmediate)
+                codectx.function_put_code(f"")
+            else:
+                stack.pop()
+                codectx.function_close_scope()
+                if len(stack) > 0:
+                    codectx.function_put_code(f"") # after the nested scope
+
+        return type_void(),True,None
+
+    def codegen_open(self,codectx):
+        """open the scope, returns the body"""
         codectx.function_open_scope()
         
         codectx.function_put_code(f"")
-        for exp in self.body:
-            eType,eReg,eVal = exp.codegen_expression(codectx,needImmediate)
-            codectx.function_put_code(f"")
-        
-        codectx.function_close_scope()
-
-        return ASTObjectTypeVoid(None,token=self.token()),True,None
+        return self.body
 
 
 class ASTObjectExpressionIf(ASTObjectExpression):
     """if elif else - statements"""
+    __slots__ = ("conditions", "blocks", "tokens_")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==0)
         assert(len(listoflists)==1)
         ll = listoflists[0]
@@ -2185,7 +2690,7 @@ class ASTObjectExpressionIf(ASTObjectExpression):
         
         self.conditions = []
         self.blocks = []
-        self.tokens_ = [ll[0][1]]
+        self.tokens_ = [ll[0]]
 
         state = 1 # what is currently expected
         # 0: elif / else
@@ -2203,7 +2708,7 @@ class ASTObjectExpressionIf(ASTObjectExpression):
                 quit()
 
             if state==0:
-                self.tokens_.append(ll[llidx][1])
+                self.tokens_.append(ll[llidx])
                 if ptparse_isToken(ll[llidx],[("keyword","elif")]):
                     state = 1
                 elif ptparse_isToken(ll[llidx],[("keyword","else")]):
@@ -2285,14 +2790,14 @@ class ASTObjectExpressionIf(ASTObjectExpression):
         codectx.function_put_code(last_tag+":", indent="")
         codectx.function_put_code("# End IF")
         
-        return ASTObjectTypeVoid(pt=None,token=self.token()),True,None
+        return type_void(),True,None
 
 class ASTObjectExpressionAssignment(ASTObjectExpression):
     """Assignment of some kind"""
+    __slots__ = ("operator", "token_", "lhs", "rhs")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)>0)
         assert(tokens[0].name == "operator")
         assert(len(listoflists)==2)
@@ -2304,8 +2809,8 @@ class ASTObjectExpressionAssignment(ASTObjectExpression):
 
         self.operator = tk.value
         self.token_ = tokens[0]
-        self.lhs = ptparse_expression((False,([],[lhs])))
-        self.rhs = ptparse_expression((False,([],[rhs])))
+        self.lhs = ptparse_expression_list(lhs)
+        self.rhs = ptparse_expression_list(rhs)
         
         if not self.lhs.isWritable():
             print("PTParseError: cannot write to left-hand-side of this assignment.")
@@ -2351,10 +2856,10 @@ class ASTObjectExpressionAssignment(ASTObjectExpression):
 
 class ASTObjectExpressionFunctionCall(ASTObjectExpression):
     """Function Call"""
+    __slots__ = ("token_", "func", "arguments")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==0)
         assert(len(listoflists)==1)
         ll = listoflists[0]
@@ -2364,7 +2869,7 @@ class ASTObjectExpressionFunctionCall(ASTObjectExpression):
         
         self.token_ = ptparse_getfirsttoken(lhs)
 
-        self.func = ptparse_expression((False,([],[[lhs]])))
+        self.func = ptparse_expression(lhs)
         if not self.func.isReadable():
             print("PTParseError: cannot read/evaluate function name/pointer.")
             tokens[0].mark()
@@ -2397,7 +2902,7 @@ class ASTObjectExpressionFunctionCall(ASTObjectExpression):
         # parse the arguments
         for ll in listoflists:
             if len(ll)>0:
-                arg = ptparse_expression((False,([],[ll])))
+                arg = ptparse_expression_list(ll)
                 if not arg.isReadable():
                     print("PTParseError: cannot read/evaluate function argument.")
                     tokens[0].mark()
@@ -2441,23 +2946,39 @@ class ASTObjectExpressionBinOp(ASTObjectExpression):
     """Binary operator of any kind
     reads both sides and returns some result
     """
+    __slots__ = ("operator", "token_", "lhs", "rhs")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        # a+b+c+... is parsed as ((a+b)+c)+...
+        # the operators on the lhs spine are constructed bottom up,
+        # without recursion: the spine can be long
+        spine = [pt]
+        lhs_pt = ptparse_binop_lhs(pt)
+        while lhs_pt is not None:
+            spine.append(lhs_pt)
+            lhs_pt = ptparse_binop_lhs(lhs_pt)
+        lhs = ptparse_expression_list(spine[-1].lists[0])
+        for lhs_pt in reversed(spine[1:]):
+            op = ASTObjectExpressionBinOp.__new__(ASTObjectExpressionBinOp)
+            op.init_parse(lhs_pt, lhs)
+            lhs = op
+        self.init_parse(pt, lhs)
+
+    def init_parse(self,pt,lhs):
+        """parse pt, with the ast of its lhs"""
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==1)
         assert(tokens[0].name == "operator")
         assert(len(listoflists)==2)
         tk = tokens[0]
         assert( tk.value in ASTObjectExpressionBinOp_rtl_operators )
         
-        lhs = listoflists[0]
         rhs = listoflists[1]
 
         self.operator = tk.value
         self.token_ = tk
-        self.lhs = ptparse_expression((False,([],[lhs])))
-        self.rhs = ptparse_expression((False,([],[rhs])))
+        self.lhs = lhs
+        self.rhs = ptparse_expression_list(rhs)
         
         if not self.lhs.isReadable():
             print("PTParseError: cannot read from left-hand-side of this binary operator.")
@@ -2477,18 +2998,35 @@ class ASTObjectExpressionBinOp(ASTObjectExpression):
     def token(self):
         return self.token_
  
+    def spine(self):
+        """this and the operators on the lhs spine, see __init__"""
+        spine = [self]
+        while type(spine[-1].lhs) is ASTObjectExpressionBinOp:
+            spine.append(spine[-1].lhs)
+        return spine
+
     def print_ast(self,depth=0,step=3):
-        print(" "*depth + f"[BinOp] {self.operator}")
-        print(" "*depth + f"lhs:")
-        self.lhs.print_ast(depth = depth+step)
-        print(" "*depth + f"rhs:")
-        self.rhs.print_ast(depth = depth+step)
+        spine = self.spine()
+        for i,op in enumerate(spine):
+            print(" "*(depth+i*step) + f"[BinOp] {op.operator}")
+            print(" "*(depth+i*step) + f"lhs:")
+        spine[-1].lhs.print_ast(depth = depth+len(spine)*step)
+        for i in reversed(range(len(spine))):
+            print(" "*(depth+i*step) + f"rhs:")
+            spine[i].rhs.print_ast(depth = depth+i*step+step)
     
     def codegen_expression(self,codectx,needImmediate):
         """See super for desc"""
         
-        # get lhs:
-        lType,lReg,lVal = self.lhs.codegen_expression(codectx,needImmediate)
+        # get lhs, of the whole spine
+        spine = self.spine()
+        lType,lReg,lVal = spine[-1].lhs.codegen_expression(codectx,needImmediate)
+        for op in reversed(spine):
+            lType,lReg,lVal = op.codegen_operator(codectx,needImmediate,lType,lReg,lVal)
+        return lType,lReg,lVal
+
+    def codegen_operator(self,codectx,needImmediate,lType,lReg,lVal):
+        """codegen_expression, with the lhs already evaluated"""
         
         if lReg:
             # send to local variable
@@ -2659,7 +3197,7 @@ class ASTObjectExpressionBinOp(ASTObjectExpression):
             
             # if either not ptr: make to u64.
             if not lType.isPointer():
-                t = ASTObjectTypeNumber(None,"u64")
+                t = type_number("u64")
                 success = t.softCastRegister(codectx, lType, ASM_type_to_rcx, "xmm1")
                 if not success:
                     print(f"TypeError: could not convert number type '{lType.toStr()}' to 'u64' for pointer arithmatic.")
@@ -2675,7 +3213,7 @@ class ASTObjectExpressionBinOp(ASTObjectExpression):
                     self.token().mark()
                     quit()
             if not rType.isPointer():
-                t = ASTObjectTypeNumber(None,"u64")
+                t = type_number("u64")
                 success = t.softCastRegister(codectx, rType, ASM_type_to_rax, "xmm0")
                 if not success:
                     print(f"TypeError: could not convert number type '{rType.toStr()}' to 'u64' for pointer arithmatic.")
@@ -2706,7 +3244,7 @@ class ASTObjectExpressionBinOp(ASTObjectExpression):
                     size = rType.type.sizeof(codectx)
                     codectx.function_put_code(f"movq ${size}, %rcx")
                     codectx.function_put_code(f"idivq %rcx # rax = rax / sizeof({rType.type.toStr()})")
-                    t = ASTObjectTypeNumber(None,"i64")
+                    t = type_number("i64")
                     return t,True,None
                 else:
                     print(f"TypeError: cannot use operator on types '{lType.toStr()}' and '{rType.toStr()}'.")
@@ -2729,10 +3267,10 @@ class ASTObjectExpressionRef(ASTObjectExpression):
     """Reference of some object: a->b or a.b
     b must be a name.
     """
+    __slots__ = ("operator", "token_", "lhs", "rhs")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==1)
         assert(tokens[0].name == "operator")
         assert(len(listoflists)==2)
@@ -2752,10 +3290,10 @@ class ASTObjectExpressionRef(ASTObjectExpression):
             quit()
 
         # extract rhs name
-        self.rhs = rhs[0][1].value
+        self.rhs = rhs[0].value
 
         
-        self.lhs = ptparse_expression((False,([],[lhs])))
+        self.lhs = ptparse_expression_list(lhs)
         
         if not self.lhs.isReadable():
             print("PTParseError: cannot read from left-hand-side of this binary operator.")
@@ -2785,10 +3323,10 @@ class ASTObjectExpressionUnaryOp(ASTObjectExpression):
     """unary operator of any kind
     reads left or right side
     """
+    __slots__ = ("operator", "token_", "arg", "isRight")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==1)
         assert(tokens[0].name == "operator")
         assert(len(listoflists)==2)
@@ -2805,7 +3343,7 @@ class ASTObjectExpressionUnaryOp(ASTObjectExpression):
 
         self.operator = tk.value
         self.token_ = tk
-        self.arg = ptparse_expression((False,([],[self.arg])))
+        self.arg = ptparse_expression_list(self.arg)
         
         if not self.arg.isReadable():
             print("PTParseError: cannot read from operand of this unary operator.")
@@ -2884,6 +3422,7 @@ class ASTObjectExpressionDeclaration(ASTObjectExpression):
     const type name
     var type name
     """
+    __slots__ = ("type", "type_tokens", "isMutable", "token_", "name")
     def __init__(self,pt):
         # parse var / const definition
         l = ptparse_getlist(pt, 3)
@@ -2903,12 +3442,14 @@ class ASTObjectExpressionDeclaration(ASTObjectExpression):
             quit()
 
         # check type:
-        self.type = ptparse_type(l[1])
+        tokens = []
+        self.type = ptparse_type(l[1], tokens)
+        self.type_tokens = tuple(tokens) # see ptparse_type
 
         # check name:
         if ptparse_isToken(l[2],[("name",None)]):
-            self.token_ = l[2][1]
-            self.name = l[2][1].value
+            self.token_ = l[2]
+            self.name = l[2].value
         else:
             print("PTParseError: syntax error: expected 'const/var'")
             ptparse_markfirsttokeninlist([l[2]])
@@ -2952,7 +3493,7 @@ class ASTObjectExpressionDeclaration(ASTObjectExpression):
             self.token().mark()
             assert(False and "local var decl not implemented for non number types")
 
-        return ASTObjectTypeVoid(None,token=self.token()),True,None
+        return type_void(),True,None
 
     def codegen_assign(self,codectx,needImmediate,aType,aReg,aVal):
         """check super for desc"""
@@ -2966,12 +3507,12 @@ class ASTObjectExpressionDeclaration(ASTObjectExpression):
  
 class ASTObjectExpressionName(ASTObjectExpression):
     """const/variable name"""
+    __slots__ = ("name", "token_")
     def __init__(self,pt, _name = None, _token = None):
         """either init via pt, or set _name and _token"""
         if _name is None:
-            isToken, payload = pt
-            assert(isToken)
-            tk = payload
+            assert(pt.isToken)
+            tk = pt
             assert(tk.name == "name")
             self.name = tk.value
             self.token_ = tk
@@ -3139,10 +3680,10 @@ class ASTObjectExpressionName(ASTObjectExpression):
 
 class ASTObjectExpressionNumber(ASTObjectExpression):
     """literal number expression"""
+    __slots__ = ("number", "token_")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(isToken)
-        tk = payload
+        assert(pt.isToken)
+        tk = pt
         assert(tk.name == "num")
         self.number = tk.value
         self.token_ = tk
@@ -3162,17 +3703,17 @@ class ASTObjectExpressionNumber(ASTObjectExpression):
         """See super for desc"""
         # TODO: add multiple number types
         if "." in self.number:
-            return ASTObjectTypeNumber(None,"double"), False, np.double(self.number)
+            return type_number("double"), False, np.double(self.number)
         
         else:
-            return ASTObjectTypeNumber(None,"u64"), False, np.uint64(self.number)
+            return type_number("u64"), False, np.uint64(self.number)
 
 class ASTObjectExpressionString(ASTObjectExpression):
     """literal string expression"""
+    __slots__ = ("string", "token_")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(isToken)
-        tk = payload
+        assert(pt.isToken)
+        tk = pt
         assert(tk.name == "str")
         self.string = tk.value
         self.token_ = tk
@@ -3191,10 +3732,10 @@ class ASTObjectExpressionString(ASTObjectExpression):
 
 class ASTObjectExpressionReturn(ASTObjectExpression):
     """return statement"""
+    __slots__ = ("token_", "expression")
     def __init__(self,pt):
-        isToken, payload = pt
-        assert(not isToken)
-        tokens,listoflists = payload
+        assert(not pt.isToken)
+        tokens,listoflists = pt.tokens,pt.lists
         assert(len(tokens)==0)
         assert(len(listoflists)==1)
         l = listoflists[0]
@@ -3204,7 +3745,7 @@ class ASTObjectExpressionReturn(ASTObjectExpression):
             ptparse_markfirsttokeninlist([l[0]])
             quit()
 
-        self.token_ = l[0][1]
+        self.token_ = l[0]
 
         if len(l) !=2:
             print(f"PTParseError: syntax error in print statement. (expected 'return <expression>')")
@@ -3261,12 +3802,13 @@ class ASTObjectExpressionReturn(ASTObjectExpression):
         codectx.function_simulate_scope_teardown(0)
         codectx.function_put_code(f"jmp .fend{fid} # return")
 
-        return ASTObjectTypeVoid(None,token=self.token()),True,None
+        return type_void(),True,None
  
 class ASTObjectVarConst(ASTObject):
     """
     Var/Const ast object
     """
+    __slots__ = ("isMutable", "name", "name_token", "type", "type_tokens", "expression")
 
     def __init__(self,pt):
         self.isMutable = False # var/const - True/False
@@ -3281,9 +3823,9 @@ class ASTObjectVarConst(ASTObject):
         # check if is assignment =
         if ptparse_isdelimiterlist(pt,[("operator","=")]):
             # split by first =
-            isToken,(tokens,listoflists) = pt
-            lhs = (False,([],[listoflists[0]]))
-            rhs = (False,(tokens[1:],listoflists[1:]))
+            tokens,listoflists = pt.tokens,pt.lists
+            lhs = PTNode([],[listoflists[0]])
+            rhs = PTNode(tokens[1:],listoflists[1:])
 
             self.expression = ptparse_expression(rhs)
         else:
@@ -3307,12 +3849,14 @@ class ASTObjectVarConst(ASTObject):
             quit()
 
         # check type:
-        self.type = ptparse_type(l[1])
+        tokens = []
+        self.type = ptparse_type(l[1], tokens)
+        self.type_tokens = tuple(tokens) # see ptparse_type
 
         # check name:
         if ptparse_isToken(l[2],[("name",None)]):
-            self.name_token = l[2][1]
-            self.name = l[2][1].value
+            self.name_token = l[2]
+            self.name = l[2].value
 
     def token(self):
         return self.name_token
@@ -3327,7 +3871,7 @@ class ASTObjectVarConst(ASTObject):
     
     def checkType(self,typectx):
         """Only check type of variable"""
-        self.type.checkValid(typectx)
+        self.type.checkValid(typectx, self.type_tokens)
     
     def checkCompatible(self,other):
         """checks if two VarConst objects are compatible.
@@ -3361,8 +3905,15 @@ class ASTObjectBase(ASTObject):
     """
     Base ast object for a file
     """
-
-    def __init__(self, pt):
+    __slots__ = ("names", "functions", "varconst", "varconst_definitions", "structs", "typectx")
+
+    def __init__(self, pt, statements = None, workers = None, lazy = False):
+        """pt: of the file
+        or statements: iterable of the lists of the statements of the file,
+        instead of pt (see PTParser.parse_per_statement)
+        workers: parse the statements in a process pool of this size
+        lazy: parse function bodies on first use, see ASTObjectFunction
+        """
         ## ----------------- init
         # name used
         self.names = {}
@@ -3375,7 +3926,10 @@ class ASTObjectBase(ASTObject):
         self.structs = {}
 
         ## ----------------- parse
-        self.init_parse(pt)
+        if statements is None:
+            self.init_parse(pt, workers, lazy)
+        else:
+            self.init_statements(statements, workers, lazy)
     
     def check_name(self,ast):
         """check if name of ast is already taken"""
@@ -3420,48 +3974,78 @@ class ASTObjectBase(ASTObject):
         self.names[func.name] = func
         self.functions[func.name] = func
 
-    def init_parse(self,pt):
+    def init_parse(self,pt,workers = None,lazy = False):
         """used in __init__ to do the parsing"""
         
         # expect: semicolon list (or else take as single item)
         pt = ptparse_strip(pt)
         tokens, listoflists = ptparse_delimiter_list(pt,[("semicolon",";")])
+        self.init_statements(listoflists, workers, lazy)
 
-        # per list expect: var, const, function, struct (or empty)
+    def init_statements(self,listoflists,workers = None,lazy = False):
+        """parse the lists of the statements, in order
+        workers: size of the process pool, see init_statements_parallel
+        lazy: see ASTObjectFunction
+        """
+        if (workers is not None and workers > 1
+                and "fork" in multiprocessing.get_all_start_methods()):
+            listoflists = [l for l in listoflists if len(l) > 0]
+            if len(listoflists) >= ASTObjectBase_parallel_min:
+                self.init_statements_parallel(listoflists, workers, lazy)
+                return
         for l in listoflists:
-            if len(l)==0:
-                continue
-            elif ptparse_isToken(l[0],[("keyword","var")]):
-                # var type name
-                var = ASTObjectVarConst((False,([],[l])))
-                self.add_varconst(var)
-
-            elif ptparse_isToken(l[0],[("keyword","const")]):
-                # const type name
-                var = ASTObjectVarConst((False,([],[l])))
-                self.add_varconst(var)
-                
-            elif ptparse_isToken(l[0],[("keyword","function")]):
-                # function type name (bracket-body) {bracket-body}
-                func = ASTObjectFunction((False,([],[l])))
-                self.add_function(func)
-            
-            elif ptparse_isToken(l[0],[("keyword","struct")]):
-                # struct name {bracket-body}
-                struct = ASTObjectStruct((False,([],[l])))
-                self.add_struct(struct)
-
-            elif ptparse_isdelimiterlist(l[0],[("operator","=")]):
-                assert(len(l)==1)
-                # var/cont type name = expression
-                var = ASTObjectVarConst(l[0])
-                self.add_varconst(var)
-            else:
-                print("PTParseError: bad syntax (expect: var, const, function or struct statement)")
-                ptparse_markfirsttokeninlist(l)
-                quit()
+            ast = ptparse_base_statement(l, lazy)
+            if ast is not None:
+                self.add_statement(ast)
+
+    def init_statements_parallel(self,listoflists,workers,lazy = False):
+        """like init_statements, but the AST objects of chunks of statements
+        are built in a process pool (see ptparse_statements_chunk).
+
+        They are added here, in order, so duplicate names are reported as
+        without the pool. Chunks that fail are parsed here again, for the
+        diagnostics. The workers are forked, so they get the statements and
+        the token tables without pickling. The results refer to the tables
+        by index, see ASTPickler. With lazy, the pts of the bodies are not
+        sent back either: they are elements of the statements, and refer to
+        them by index.
+        """
+        global ASTObjectBase_parallel
+        tables = ptparse_token_tables(listoflists)
+        size = max(1, len(listoflists) // (4*workers))
+        chunks = [(a, min(a+size, len(listoflists)), lazy) for a in range(0, len(listoflists), size)]
+        ASTObjectBase_parallel = (listoflists, tables)
+        # unpickling makes many objects, see BasicParser.parse
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            ctx = multiprocessing.get_context("fork")
+            with concurrent.futures.ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+                for (a,b,_),res in zip(chunks, pool.map(ptparse_statements_chunk, chunks)):
+                    if res is None:
+                        # quits with the error (or the result was not picklable)
+                        for l in listoflists[a:b]:
+                            self.add_statement(ptparse_base_statement(l, lazy))
+                        continue
+                    data, outputs = res
+                    for ast,output in zip(pickle.loads(data), outputs):
+                        sys.stdout.write(output)
+                        self.add_statement(ast)
+        finally:
+            ASTObjectBase_parallel = None
+            if enabled:
+                gc.enable()
+
+    def add_statement(self, ast):
+        """ ast: of a statement, see ptparse_base_statement
+        """
+        if type(ast) is ASTObjectFunction:
+            self.add_function(ast)
+        elif type(ast) is ASTObjectStruct:
+            self.add_struct(ast)
+        else:
+            self.add_varconst(ast)
 
-    
     def print_ast(self,depth=0,step=3):
         print(" "*depth + f"[Base]")
         print(" "*depth + f"varconst:")
@@ -3474,6 +4058,12 @@ class ASTObjectBase(ASTObject):
         for name,func in self.functions.items():
             func.print_ast(depth = depth+step)
 
+    def parse_bodies(self):
+        """parse all function bodies now, if they are parsed on first use
+        (see ASTObjectFunction, lazy)"""
+        for name,func in self.functions.items():
+            func.parse_body()
+
     def typecheck(self):
         typectx = TypeCTX() # new type context
         self.typectx = typectx
@@ -3574,6 +4164,136 @@ class ASTObjectBase(ASTObject):
             codectx.function_close()
 
 
+def ptparse_base_statement(l, lazy = False):
+    """AST object of a statement of the file (list l), None if empty
+    lazy: see ASTObjectFunction
+    """
+    # expect: var, const, function, struct (or empty)
+    if len(l)==0:
+        return None
+    elif ptparse_isToken(l[0],[("keyword","var")]):
+        # var type name
+        return ASTObjectVarConst(PTNode([],[l]))
+
+    elif ptparse_isToken(l[0],[("keyword","const")]):
+        # const type name
+        return ASTObjectVarConst(PTNode([],[l]))
+        
+    elif ptparse_isToken(l[0],[("keyword","function")]):
+        # function type name (bracket-body) {bracket-body}
+        return ASTObjectFunction(PTNode([],[l]), lazy)
+    
+    elif ptparse_isToken(l[0],[("keyword","struct")]):
+        # struct name {bracket-body}
+        return ASTObjectStruct(PTNode([],[l]))
+
+    elif ptparse_isdelimiterlist(l[0],[("operator","=")]):
+        assert(len(l)==1)
+        # var/cont type name = expression
+        return ASTObjectVarConst(l[0])
+    else:
+        print("PTParseError: bad syntax (expect: var, const, function or struct statement)")
+        ptparse_markfirsttokeninlist(l)
+        quit()
+
+# init_statements_parallel: minimal number of statements
+ASTObjectBase_parallel_min = 64
+
+# init_statements_parallel: (statements, token tables), for the forked workers
+ASTObjectBase_parallel = None
+
+def ptparse_token_tables(listoflists):
+    """all TokenTables of the file of the statements: the table of the file
+    and the tables it imports (also macro bodies), in a list
+    """
+    tk = None
+    for l in listoflists:
+        tk = PTNode_first(l)
+        if tk is not None:
+            break
+    if tk is None:
+        return []
+    while tk.parent is not None:
+        tk = tk.parent
+    tables = []
+    seen = set()
+    todo = [tk.table]
+    while len(todo) > 0:
+        table = todo.pop()
+        if id(table) in seen:
+            continue
+        seen.add(id(table))
+        tables.append(table)
+        todo.extend(table.imports.values())
+    return tables
+
+def ptparse_token_table(i):
+    """unpickle a TokenTable, see ASTPickler"""
+    return ASTObjectBase_parallel[1][i]
+
+def ptparse_statement_element(i, j):
+    """unpickle a PTNode, element j of statement i, see ASTPickler"""
+    return ASTObjectBase_parallel[0][i][j]
+
+class ASTPickler(pickle.Pickler):
+    """pickles AST objects, with the TokenTables of their Tokens by index
+    into the tables of ASTObjectBase_parallel (the same in all processes).
+    Tokens are pickled as their table, row and up (and are memoized).
+    Types are pickled as their key, so they are interned again.
+    PTNodes that are elements of the statements (a, b) of
+    ASTObjectBase_parallel (eg. lazy bodies) are pickled by their index.
+    """
+    def __init__(self, f, tables, statements = (0, 0)):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.index = {id(t):i for i,t in enumerate(tables)}
+        a, b = statements
+        self.elements = {id(e):(i,j) for i in range(a, b)
+                         for j,e in enumerate(ASTObjectBase_parallel[0][i]) if not e.isToken}
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[lexer.Token] = self.reduce_token
+        self.dispatch_table[lexer.TokenTable] = self.reduce_table
+        self.dispatch_table[PTNode] = self.reduce_node
+        for c in [ASTObjectTypeVoid, ASTObjectTypeNumber, ASTObjectTypeStruct,
+                  ASTObjectTypePointer, ASTObjectTypeFunction]:
+            self.dispatch_table[c] = self.reduce_type
+
+    def reduce_token(self, tk):
+        return (lexer.TokenTable.token, (tk.table, tk.row, tk.up))
+
+    def reduce_table(self, table):
+        return (ptparse_token_table, (self.index[id(table)],))
+
+    def reduce_node(self, node):
+        e = self.elements.get(id(node))
+        if e is not None:
+            return (ptparse_statement_element, e)
+        return node.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+    def reduce_type(self, t):
+        return (type_interned, (t.intern_key(),))
+
+def ptparse_statements_chunk(job):
+    """worker of ASTObjectBase.init_statements_parallel
+    job: (a, b, lazy), statements a:b of ASTObjectBase_parallel
+    returns (AST objects pickled with ASTPickler, what was printed per
+    statement), None if parsing failed (or the result cannot be pickled)
+    """
+    a, b, lazy = job
+    listoflists, tables = ASTObjectBase_parallel
+    asts = []
+    outputs = []
+    f = io.BytesIO()
+    try:
+        for l in listoflists[a:b]:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                asts.append(ptparse_base_statement(l, lazy))
+            outputs.append(out.getvalue())
+        ASTPickler(f, tables, (a, b)).dump(asts)
+    except (SystemExit, Exception):
+        return None
+    return f.getvalue(), outputs
+
 class PTParser():
     """Take parse tree pt, produce ast of AST objects
     Via recursive decent.
@@ -3584,11 +4304,46 @@ class PTParser():
     def __init__(self):
         pass
 
-    def parse(self, pt):
+    def parse(self, pt, workers = None, lazy = False):
         """parsing a pt into an ast
         input: pt that needs to be turned into ast
+        workers: build the AST objects of the statements in a process pool
+        lazy: parse function bodies on first use (see ASTObjectFunction),
+            the pts of the bodies are kept until then
         """
-        return ASTObjectBase(pt)
+        # see BasicParser.parse: the pt of its single pass is still young,
+        # the collections during the build would scan it over and over
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return ASTObjectBase(pt, workers = workers, lazy = lazy)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def parse_per_statement(self, tokens, parser = None, workers = None, lazy = False):
+        """parsing tokens into an ast, with a pt per statement instead of
+        the pt of the whole file
+        input: tokens, as for BasicParser.parse (any iterable, consumed once)
+        workers, lazy: as for parse, with workers the pts of all statements are kept
+        The pt of a statement is built by BasicParser.parse_statements, the
+        AST objects by the same ptparse_* code as parse, then the pt is
+        dropped. So peak memory is lower, the work is the same.
+        Same ast as parse(BasicParser().parse(tokens)). Errors are found in
+        file order: a statement is built before the brackets after it are
+        checked, so an error in it comes before a bracket error later on.
+        """
+        if parser is None:
+            parser = BasicParser()
+        # see BasicParser.parse
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            statements = (nodes for nodes,tk in parser.parse_statements(tokens))
+            return ASTObjectBase(None, statements, workers, lazy)
+        finally:
+            if enabled:
+                gc.enable()
 
 
 
@@ -3602,28 +4357,46 @@ def main(argv):
         print("Input error: need file input and output for parser/compiler!")
         quit()
     
-    l = lexer.BasicLexer()
+    # opt-in on-disk token cache for imported files
+    l = lexer.BasicLexer(cache_dir = os.environ.get("PYCOMP_LEXER_CACHE"))
     
     print("Lexing...")
-    tokens = l.lex(seq,filename)
+    jobs = os.environ.get("PYCOMP_LEXER_JOBS")
+    if jobs is not None:
+        tokens = l.lex_parallel(seq,filename,int(jobs))
+        if l.fallback is not None:
+            print(f"Lexing without workers: {l.fallback}")
+    else:
+        tokens = l.lex(seq,filename)
     print([str(t) for t in tokens])
     
-    print("Parsing tokens into pt ...")
-    
-    p = BasicParser()
-   
-    pt = p.parse(tokens)
-    print(pt)
-    p.print_parse_tree(pt)
-
-    print("Parsing pt into ast ...")
-    ptp = PTParser()
-    
-    pt2 = ptparse_strip(pt)
-    p.print_parse_tree(pt)
+    # opt-in: AST objects of the statements in a process pool
+    parser_jobs = os.environ.get("PYCOMP_PARSER_JOBS")
+    if parser_jobs is not None:
+        parser_jobs = int(parser_jobs)
+    # opt-in: parse function bodies on first use
+    lazy = os.environ.get("PYCOMP_PARSER_LAZY") is not None
+    if os.environ.get("PYCOMP_PARSER_PER_STATEMENT") is not None:
+        # opt-in: a pt per statement, not of the whole file (less memory)
+        print("Parsing tokens into ast, one statement at a time ...")
+        ast = PTParser().parse_per_statement(tokens, workers = parser_jobs, lazy = lazy)
+    else:
+        print("Parsing tokens into pt ...")
+        
+        p = BasicParser()
+       
+        pt = p.parse(tokens)
+        print(pt)
+        p.print_parse_tree(pt)
+
+        print("Parsing pt into ast ...")
+        ptp = PTParser()
+        
+        pt2 = ptparse_strip(pt)
+        p.print_parse_tree(pt)
 
-    ast = ptp.parse(pt)
-    ast.print_ast()
+        ast = ptp.parse(pt, workers = parser_jobs, lazy = lazy)
+    ast.print_ast() # if lazy: parses the bodies (see ASTObjectFunction.body)
 
     ast.typecheck()
     
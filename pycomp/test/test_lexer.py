@@ -0,0 +1,178 @@
+"""Tests of BasicLexer: the engines must give the same tokens as the FSM,
+the preprocessor lines (DEFINE, UNDEFINE, IFDEF, ENDIF), decode_string must
+decode like the per-character decoder it replaced, and after an edit, relex
+must give the same tokens as when lexing the new sequence from scratch.
+
+    python3 -m pytest test/test_lexer.py
+"""
+
+import sys
+import os
+import io
+import glob
+import contextlib
+import pytest
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(test_dir, "..", "src"))
+import lexer
+
+def tokens_of(table):
+    return [(t.name, t.value, t.line, t.start) for t in table]
+
+def stream_of(table):
+    """tokens with the file they come from (imports)"""
+    return [(t.name, t.value, t.line, t.start, t.lex.filename, t.depth) for t in table]
+
+def lex_stream(engine, seq, filename):
+    """token stream of seq, or the error message if lexing quits"""
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            return stream_of(lexer.BasicLexer(engine=engine).lex(seq, filename))
+    except SystemExit:
+        return out.getvalue()
+
+def check_engine(engine, monkeypatch):
+    """engine gives the same token stream as the FSM on all test scripts"""
+    monkeypatch.chdir(test_dir) # imports are relative
+    for filename in sorted(glob.glob("*.script")):
+        seq = open(filename).read()
+        assert lex_stream(engine, seq, filename) == lex_stream("fsm", seq, filename), filename
+
+def test_engine_regex(monkeypatch):
+    check_engine("regex", monkeypatch)
+
+def test_engine_numpy(monkeypatch):
+    check_engine("numpy", monkeypatch)
+
+def test_engine_edges():
+    # no final newline, characters above 255, open comment, escapes, errors
+    for seq in ["", "x", "a = b;", "a\n\n  b  ", "/* \u20ac\n */ x", "s = \"\u20ac\\x41\\n\";\n",
+                "/* open", "x // \u00e9\u20ac", "a = \"\\q\";\n", "a $ b\n", "x = \u20ac;\n"]:
+        fsm = lex_stream("fsm", seq, "f")
+        for engine in ["regex", "numpy"]:
+            assert lex_stream(engine, seq, "f") == fsm, (engine, seq)
+
+def check_relex(seq, first, last, text):
+    """relex lines first:last of seq to text, compare with a full lex"""
+    old = lexer.BasicLexer().lex(seq, "f")
+    es = lexer.lex_line_offset(seq, first)
+    ee = lexer.lex_line_offset(seq, last)
+    new = seq[:es] + text + seq[ee:]
+    relexed = lexer.BasicLexer().relex(old, seq, "f", first, last, text)
+    assert tokens_of(relexed) == tokens_of(lexer.BasicLexer().lex(new, "f"))
+
+def test_relex_column_after_edit():
+    # text without newline: the rest of the end line moves right
+    check_relex("a b\nc d\n", 0, 1, "xx ")
+    check_relex("a b\nc d e\nf\n", 1, 2, "yyy zz ")
+
+def test_relex_token_at_edit_start():
+    # '/' right before the edit becomes the start of a comment
+    check_relex("a /", 1, 1, "/ b\n")
+    check_relex("x = a -", 1, 1, "> b;\n")
+
+def test_relex_lines():
+    seq = "var i32 x;\n/* c\n c */ x = 1;\nfunction f() {\n  return x;\n};\n"
+    check_relex(seq, 1, 2, "x = 2;\n")
+    check_relex(seq, 0, 0, "var i32 y;\n")
+    check_relex(seq, 3, 5, "")
+    check_relex(seq, 1, 1, "/* ")
+
+# preprocessor: DEFINE, UNDEFINE, IFDEF, ENDIF, the same with all engines
+
+Engines = ["fsm", "regex", "numpy"]
+
+def values_of(engine, seq):
+    """(value, line, depth) of the tokens of seq, or the error message"""
+    stream = lex_stream(engine, seq, "f")
+    if isinstance(stream, str):
+        return stream
+    return [(value, line, depth) for name, value, line, start, filename, depth in stream]
+
+def test_ifdef_nested():
+    seq = ("#DEFINE A 1\n#IFDEF A\na\n"
+           "#IFDEF B\nb\n#IFDEF A\nc\n#ENDIF\n#ENDIF\n" # skipped, with its inner IFDEF
+           "d\n#ENDIF\ne\n")
+    for engine in Engines:
+        assert values_of(engine, seq) == [("a", 2, 0), ("d", 9, 0), ("e", 11, 0)], engine
+
+def test_ifdef_without_endif():
+    for seq in ["#DEFINE A 1\n#IFDEF A\na\n", # defined: open at the end
+                "a\n#IFDEF B\nb\n"]: # not defined: no ENDIF to skip to
+        for engine in Engines:
+            error = values_of(engine, seq)
+            assert error.startswith("PreprocessorError: IFDEF without ENDIF.\nin f:1\n"), (engine, seq)
+
+def test_endif_without_ifdef():
+    for engine in Engines:
+        error = values_of(engine, "a\n#ENDIF\nb\n")
+        assert error.startswith("PreprocessorError: ENDIF without IFDEF.\nin f:1\n"), engine
+
+def test_undefine():
+    seq = "#DEFINE A 1\nx = A;\n#UNDEFINE A\ny = A;\n#IFDEF A\nz\n#ENDIF\n"
+    for engine in Engines:
+        assert values_of(engine, seq) == [
+            ("x", 1, 0), ("=", 1, 0), ("1", 0, 1), (";", 1, 0),
+            ("y", 3, 0), ("=", 3, 0), ("A", 3, 0), (";", 3, 0)], engine
+
+def test_macro_spliced_twice():
+    seq = "#DEFINE N 1 + 2\nx = N * N;\n"
+    body = [("1", 0, 1), ("+", 0, 1), ("2", 0, 1)]
+    for engine in Engines:
+        assert values_of(engine, seq) == [("x", 1, 0), ("=", 1, 0)] + body + [("*", 1, 0)] + body + [(";", 1, 0)], engine
+        # both splices reference the tokens of the DEFINE, anchored at their use
+        tokens = list(lexer.BasicLexer(engine=engine).lex(seq, "f"))
+        assert [t.parent.start for t in tokens if t.depth == 1] == [4, 4, 4, 8, 8, 8], engine
+
+# decode_string (one re.sub) against the per-character decoder it replaced
+
+def decode_string_per_char(value):
+    """the old decoder of string escapes, one state per character"""
+    res = []
+    state = None
+    xval = ""
+    for c in value:
+        if state is None:
+            if c != "\\":
+                res.append(c)
+            else:
+                state = "esc"
+        elif state == "esc":
+            d = {"n":"\n", "t":"\t", "\'":"\'", "\"": "\"","\\":"\\"}
+            if c in d:
+                res.append(d[c])
+                state = None
+            elif c == "x":
+                state = "h1"
+                xval = ""
+            else:
+                print(c, ord(c), value)
+                assert(False)
+        elif state == "h1": # for \x
+            xval = c
+            state = "h2"
+        elif state == "h2": # for \x
+            xval += c
+            state = None
+            res.append(chr( int(xval, 16) ))
+    return "".join(res)
+
+def test_decode_string_escapes():
+    escapes = ["\\n", "\\t", "\\'", "\\\"", "\\\\"]
+    escapes += [f"\\x{i:02x}" for i in range(256)] + [f"\\x{i:02X}" for i in range(256)]
+    for e in escapes:
+        for value in [e, "a" + e + "b", e + e, "\\\\" + e, e + "x41"]:
+            assert lexer.decode_string(value) == decode_string_per_char(value), value
+    value = "plain € " + "".join(escapes)
+    assert lexer.decode_string(value) == decode_string_per_char(value)
+    assert lexer.decode_string("no escapes") == "no escapes"
+
+def test_decode_string_invalid_escape(capsys):
+    outputs = []
+    for decode in [lexer.decode_string, decode_string_per_char]:
+        with pytest.raises(AssertionError):
+            decode("a\\x41\\qb")
+        outputs.append(capsys.readouterr().out)
+    assert outputs[0] == outputs[1] == "q 113 a\\x41\\qb\n"